@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = "yatube"
@@ -24,12 +26,23 @@ from django.utils.version import get_version
 
 assert get_version() < "3.0.0", "Пожалуйста, используйте версию Django < 3.0.0"
 
+from django.test import override_settings
+
+from core.runner import temporary_caches
 from yatube.settings import INSTALLED_APPS
 
 assert any(
     app in INSTALLED_APPS for app in ["posts.apps.PostsConfig", "posts"]
 ), "Пожалуйста зарегистрируйте приложение в `settings.INSTALLED_APPS`"
 
+
+@pytest.fixture(autouse=True, scope="session")
+def temporary_cache_directory(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("cache"))
+    with override_settings(CACHES=temporary_caches(directory)):
+        yield
+
+
 pytest_plugins = [
     "tests.fixtures.fixture_user",
     "tests.fixtures.fixture_data",
@@ -0,0 +1,235 @@
+import datetime
+import hashlib
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .fragments import fill
+
+
+def version_key(scope):
+    return f"version:{scope}"
+
+
+def get_versions(*scopes):
+    """
+    Return the current version of every scope. A missing version starts at
+    the current time, so a version lost to eviction never comes back to an
+    old value with pages still cached under it.
+    """
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _set_versions(scopes):
+    cache.set_many(
+        {version_key(scope): time.time_ns() for scope in scopes}, None
+    )
+
+
+def bump_versions(*scopes):
+    """
+    Move scopes to a new version now and once more after the transaction
+    commits, so a page rendered from data read before the commit is not
+    served under the new version.
+    """
+    _set_versions(scopes)
+    transaction.on_commit(lambda: _set_versions(scopes))
+
+
+def jittered(timeout):
+    """Shorten timeout by a random share so entries do not expire at once."""
+    return timeout * (1 - random.uniform(0, settings.CACHE_TTL_JITTER))
+
+
+@contextmanager
+def cache_lock(name):
+    """
+    Hold lock:{name} across processes, waiting up to CACHE_LOCK_TIMEOUT for
+    another holder to release it; TimeoutError after that.
+    """
+    lock_key = f"lock:{name}"
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while not cache.add(lock_key, True, settings.CACHE_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(lock_key)
+        time.sleep(settings.CACHE_LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        cache.delete(lock_key)
+
+
+def wait_for_holder(key, lock_key):
+    """
+    Poll for the entry stored by the holder of lock_key. Return None once
+    the lock is released without one and this caller took it over.
+    """
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(settings.CACHE_LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.add(lock_key, True, settings.CACHE_LOCK_TIMEOUT):
+            return None
+    raise TimeoutError(lock_key)
+
+
+def get_or_compute(key, compute, timeout, cacheable=None,
+                   stale_timeout=None):
+    """
+    Return the value cached under key, computing it on a miss.
+
+    Entries outlive timeout by stale_timeout seconds (CACHE_STALE_TIMEOUT by
+    default): a stale value is still served while a single caller holding a
+    short lock computes the fresh one. On a cold miss the callers without
+    the lock wait for the value while the lock is held, up to
+    CACHE_LOCK_TIMEOUT seconds; when it is released without a value, as
+    after an error or an uncacheable result, the next of them takes it.
+    cacheable decides whether a computed value is stored at all.
+    """
+    lock_key = f"lock:{key}"
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until or not cache.add(
+            lock_key, True, settings.CACHE_LOCK_TIMEOUT
+        ):
+            return value
+    elif not cache.add(lock_key, True, settings.CACHE_LOCK_TIMEOUT):
+        try:
+            entry = wait_for_holder(key, lock_key)
+        except TimeoutError:
+            return compute()
+        if entry is not None:
+            return entry[0]
+    try:
+        value = compute()
+        if cacheable is None or cacheable(value):
+            if stale_timeout is None:
+                stale_timeout = settings.CACHE_STALE_TIMEOUT
+            timeout = jittered(timeout)
+            cache.set(
+                key,
+                (value, time.time() + timeout),
+                timeout + stale_timeout,
+            )
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+def cache_page_versioned(timeout, *scopes):
+    """
+    Cache a view response once for all users under the versions of scopes.
+    Scopes are format strings filled with the view kwargs, e.g.
+    "group:{slug}", so a bump of any of them makes the page render again.
+
+    Templates included with the fragment tag depend on the user: they are
+    left as placeholders in the cached page and rendered for each request.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            versions = get_versions(
+                *(scope.format(**kwargs) for scope in scopes)
+            )
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = "page:{}:{}:{}".format(
+                view.__name__, path, ".".join(map(str, versions))
+            )
+
+            def render():
+                request.defer_fragments = True
+                try:
+                    return view(request, *args, **kwargs)
+                finally:
+                    request.defer_fragments = False
+
+            response = get_or_compute(
+                key,
+                render,
+                timeout,
+                cacheable=lambda response: (
+                    response.status_code == 200 and not response.streaming
+                ),
+            )
+            if not response.streaming:
+                fill(request, response)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def condition_versioned(state):
+    """
+    Answer conditional GETs with 304 before the view runs.
+
+    state(request, **kwargs) returns the scopes the page is built from and
+    the latest pub_date or created on it, or None when there is no page.
+    The ETag covers the scope versions, that date and the user, since the
+    header is personal; Last-Modified is the newest of the date and the
+    version stamps.
+
+    For a signed in user the ETag also covers the CSRF token and the date
+    is at least the last login, so a form cached before the token rotated
+    at login is not reused.
+    """
+
+    def personal(request):
+        if not request.user.is_authenticated:
+            return ""
+        get_token(request)
+        return "{}:{}".format(request.user.pk, request.META["CSRF_COOKIE"])
+
+    def validators(request, **kwargs):
+        if not hasattr(request, "page_validators"):
+            request.page_validators = None, None
+            page = state(request, **kwargs)
+            if page is not None:
+                scopes, latest = page
+                versions = get_versions(*scopes)
+                etag = hashlib.md5(
+                    "{}:{}:{}".format(
+                        personal(request),
+                        ".".join(map(str, versions)),
+                        latest.isoformat() if latest else "",
+                    ).encode()
+                ).hexdigest()
+                modified = datetime.datetime.fromtimestamp(
+                    max(versions) / 10 ** 9, timezone.utc
+                )
+                last_login = getattr(request.user, "last_login", None)
+                for date in (latest, last_login):
+                    if date is not None:
+                        modified = max(modified, date)
+                request.page_validators = etag, modified
+        return request.page_validators
+
+    return condition(
+        etag_func=lambda request, *args, **kwargs: (
+            validators(request, **kwargs)[0]
+        ),
+        last_modified_func=lambda request, *args, **kwargs: (
+            validators(request, **kwargs)[1]
+        ),
+    )
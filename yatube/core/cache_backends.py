@@ -0,0 +1,405 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed_idx ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_inserted AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET entries = entries + 1, size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_deleted AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET entries = entries - 1, size = size - old.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_updated AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_stats SET size = size - old.size + new.size;
+END;
+"""
+CHANGES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    key TEXT,
+    version INTEGER,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_created_idx ON changes (created);
+"""
+# Reads refresh the LRU position of an entry at most this often, so hot
+# keys do not turn every read into a write.
+ACCESS_RESOLUTION = 1
+
+
+def placeholders(values):
+    return ", ".join("?" * len(values))
+
+
+class Database:
+    """SQLite database in WAL mode with a connection per thread and process."""
+
+    def __init__(self, location, schema, busy_timeout):
+        self.location = location
+        self.schema = schema
+        self.busy_timeout = busy_timeout
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        local = self.local
+        if getattr(local, "pid", None) != os.getpid():
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.location,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.schema)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def execute(self, sql, params=()):
+        return self.connection.execute(sql, params)
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache in an SQLite database in WAL mode, shared by every process on the
+    host that points LOCATION at the same file.
+
+    Entries past MAX_ENTRIES or past MAX_SIZE bytes of pickled values are
+    evicted least recently used first, after expired ones.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.location = location
+        self.max_size = int(options.get("MAX_SIZE", 64 * 1024 * 1024))
+        self.database = Database(
+            location, SCHEMA, float(options.get("BUSY_TIMEOUT", 5))
+        )
+
+    @property
+    def connection(self):
+        return self.database.connection
+
+    def execute(self, sql, params=()):
+        return self.database.execute(sql, params)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store("INSERT OR IGNORE", key, value, timeout, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store("INSERT OR REPLACE", key, value, timeout, version)
+
+    def _store(self, verb, key, value, timeout, version):
+        key = self._key(key, version)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self.connection:
+            self.execute("BEGIN IMMEDIATE")
+            if verb == "INSERT OR IGNORE":
+                self.execute(
+                    "DELETE FROM cache WHERE key = ? AND expires <= ?",
+                    (key, now),
+                )
+            stored = self.execute(
+                f"{verb} INTO cache (key, value, size, expires, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), self.get_backend_timeout(timeout), now),
+            ).rowcount
+            self._cull(now)
+        return bool(stored)
+
+    def _cull(self, now):
+        entries, size = self.execute(
+            "SELECT entries, size FROM cache_stats"
+        ).fetchone()
+        if entries <= self._max_entries and size <= self.max_size:
+            return
+        self.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        while True:
+            entries, size = self.execute(
+                "SELECT entries, size FROM cache_stats"
+            ).fetchone()
+            if entries <= self._max_entries and size <= self.max_size:
+                return
+            self.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (max(1, entries // self._cull_frequency),),
+            )
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self.execute(
+            "SELECT key, value FROM cache "
+            f"WHERE key IN ({placeholders(keys)}) "
+            "AND (expires IS NULL OR expires > ?)",
+            (*keys, now),
+        ).fetchall()
+        if rows:
+            self.execute(
+                f"UPDATE cache SET accessed = ? "
+                f"WHERE key IN ({placeholders(rows)}) AND accessed < ?",
+                (now, *(row[0] for row in rows), now - ACCESS_RESOLUTION),
+            )
+        return {keys[key]: pickle.loads(value) for key, value in rows}
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return bool(
+            self.execute(
+                "UPDATE cache SET expires = ? WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (
+                    self.get_backend_timeout(timeout),
+                    self._key(key, version),
+                    time.time(),
+                ),
+            ).rowcount
+        )
+
+    def delete(self, key, version=None):
+        self.execute(
+            "DELETE FROM cache WHERE key = ?", (self._key(key, version),)
+        )
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            self.execute(
+                f"DELETE FROM cache WHERE key IN ({placeholders(keys)})",
+                keys,
+            )
+
+    def has_key(self, key, version=None):
+        return (
+            self.execute(
+                "SELECT 1 FROM cache WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (self._key(key, version), time.time()),
+            ).fetchone()
+            is not None
+        )
+
+    def clear(self):
+        self.execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        pass
+
+
+class ChangeLogPosition:
+    """
+    How far a process has read the change log into one L1 storage. Django
+    creates a cache instance per thread, but they share L1 by name, so they
+    share this too.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.origin = self.last_seen = self.last_poll = None
+
+
+_positions = {}
+
+
+class TieredCache(BaseCache):
+    """
+    In-process L1 cache in front of the shared cache named by the L2 option.
+
+    Reads are served from L1 for up to L1_TIMEOUT seconds. Every write and
+    delete is appended to a change log in the SQLite file at LOCATION, which
+    each process reads at most every POLL_INTERVAL seconds to evict the
+    changed keys from its L1, so a change reaches all workers within
+    POLL_INTERVAL plus the time to the next request. L1 is the in-process
+    LocMemCache named by the L1_NAME option, "tiered:<LOCATION>" by default.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.l2_alias = options.get("L2", "shared")
+        self.l1_timeout = float(options.get("L1_TIMEOUT", 5))
+        self.poll_interval = float(options.get("POLL_INTERVAL", 0.5))
+        self.retention = float(options.get("LOG_RETENTION", 300))
+        self.l1_name = options.get("L1_NAME", f"tiered:{location}")
+        self.l1 = LocMemCache(
+            self.l1_name,
+            {
+                "OPTIONS": {
+                    "MAX_ENTRIES": options.get("L1_MAX_ENTRIES", 1000)
+                }
+            },
+        )
+        self.log = Database(
+            location, CHANGES_SCHEMA, float(options.get("BUSY_TIMEOUT", 5))
+        )
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    @property
+    def position(self):
+        # Keyed by pid too: a forked worker inherits a copy of L1 that it
+        # must clear on its first sync.
+        key = (os.getpid(), self.l1_name)
+        position = _positions.get(key)
+        if position is None:
+            position = _positions.setdefault(key, ChangeLogPosition())
+        return position
+
+    def sync(self):
+        """Evict keys changed by other processes since the last poll."""
+        now = time.monotonic()
+        position = self.position
+        if (
+            position.origin is not None
+            and now - position.last_poll < self.poll_interval
+        ):
+            return
+        with position.lock:
+            if position.origin is None:
+                self.l1.clear()
+                position.last_poll = now
+                position.last_seen = self.log.execute(
+                    "SELECT COALESCE(MAX(id), 0) FROM changes"
+                ).fetchone()[0]
+                position.origin = f"{os.getpid()}:{self.l1_name}"
+                return
+            if now - position.last_poll < self.poll_interval:
+                return
+            stale = now - position.last_poll > self.retention / 2
+            position.last_poll = now
+            rows = self.log.execute(
+                "SELECT id, origin, key, version FROM changes WHERE id > ?",
+                (position.last_seen,),
+            ).fetchall()
+            if stale:
+                self.l1.clear()
+            for row_id, row_origin, key, version in rows:
+                position.last_seen = row_id
+                if row_origin == position.origin:
+                    continue
+                if key is None:
+                    self.l1.clear()
+                else:
+                    self.l1.delete(key, version)
+            if rows:
+                self.log.execute(
+                    "DELETE FROM changes WHERE created < ?",
+                    (time.time() - self.retention,),
+                )
+
+    def changed(self, keys, version=None):
+        self.sync()
+        origin = self.position.origin
+        with self.log.connection:
+            self.log.execute("BEGIN IMMEDIATE")
+            self.log.connection.executemany(
+                "INSERT INTO changes (origin, key, version, created) "
+                "VALUES (?, ?, ?, ?)",
+                [(origin, key, version, time.time()) for key in keys],
+            )
+
+    def l1_timeout_for(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self.l1_timeout
+        return min(self.l1_timeout, timeout - time.time())
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        self.sync()
+        found = self.l1.get_many(keys, version=version)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            fetched = self.l2.get_many(missing, version=version)
+            self.l1.set_many(fetched, self.l1_timeout, version=version)
+            found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added:
+            self.changed([key], version)
+            self.l1.set(key, value, self.l1_timeout_for(timeout), version)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version)
+        self.changed(list(data), version)
+        self.l1.set_many(data, self.l1_timeout_for(timeout), version=version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.changed([key], version)
+        self.l1.delete(key, version)
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version=version)
+        self.changed(keys, version)
+        self.l1.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        self.changed([key], version)
+        self.l1.delete(key, version)
+        return value
+
+    def clear(self):
+        self.l2.clear()
+        self.changed([None])
+        self.l1.clear()
+
+    def close(self, **kwargs):
+        pass
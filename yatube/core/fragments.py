@@ -0,0 +1,46 @@
+import base64
+import json
+import re
+
+from django.template.loader import render_to_string
+
+PLACEHOLDER = re.compile(r"<!--fragment:([\w=-]+)-->")
+
+_providers = {}
+
+
+def provider(template_name):
+    """
+    Register a function building the context of a per-request fragment
+    from the request and the arguments given to the fragment tag.
+    """
+
+    def decorator(func):
+        _providers[template_name] = func
+        return func
+
+    return decorator
+
+
+def render_fragment(request, template_name, *args):
+    context = {}
+    if template_name in _providers:
+        context = _providers[template_name](request, *args)
+    return render_to_string(template_name, context, request)
+
+
+def placeholder(template_name, *args):
+    raw = json.dumps([template_name, args], separators=(",", ":")).encode()
+    return "<!--fragment:{}-->".format(base64.urlsafe_b64encode(raw).decode())
+
+
+def fill(request, response):
+    """Render the fragments left as placeholders in a shared response."""
+    content = response.content.decode(response.charset)
+
+    def render(match):
+        template_name, args = json.loads(base64.urlsafe_b64decode(match[1]))
+        return render_fragment(request, template_name, *args)
+
+    response.content = PLACEHOLDER.sub(render, content)
+    return response
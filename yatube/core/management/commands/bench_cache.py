@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache_backends import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает SQLiteCache с LocMemCache и FileBasedCache: время "
+        "записи и чтения и видимость записей из другого процесса."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keys", type=int, default=1000)
+        parser.add_argument("--value-size", type=int, default=20_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        params = {"OPTIONS": {"MAX_ENTRIES": options["keys"] * 2}}
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                "locmem": LocMemCache("bench", params),
+                "filebased": FileBasedCache(
+                    os.path.join(directory, "files"), params
+                ),
+                "sqlite": SQLiteCache(
+                    os.path.join(directory, "cache.sqlite3"), params
+                ),
+            }
+            value = os.urandom(options["value_size"])
+            keys = [f"bench:{i}" for i in range(options["keys"])]
+            for name, backend in backends.items():
+                writes, reads = self.measure(
+                    backend, keys, value, options["repeat"]
+                )
+                self.stdout.write(
+                    f"{name:>9}: set {statistics.median(writes):.1f} us, "
+                    f"get {statistics.median(reads):.1f} us, "
+                    f"shared: "
+                    f"{'yes' if self.is_shared(backend, keys[0]) else 'no'}"
+                )
+
+    def measure(self, backend, keys, value, repeat):
+        writes, reads = [], []
+        for _ in range(repeat):
+            backend.clear()
+            started = time.perf_counter()
+            for key in keys:
+                backend.set(key, value)
+            writes.append((time.perf_counter() - started) / len(keys) * 1e6)
+            started = time.perf_counter()
+            for key in keys:
+                backend.get(key)
+            reads.append((time.perf_counter() - started) / len(keys) * 1e6)
+        return writes, reads
+
+    def is_shared(self, backend, key):
+        backend.delete(key)
+        context = multiprocessing.get_context("fork")
+        child = context.Process(target=backend.set, args=(key, "child"))
+        child.start()
+        child.join()
+        return backend.get(key) == "child"
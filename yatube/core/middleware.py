@@ -0,0 +1,70 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from .cache import get_or_compute, get_versions
+
+
+class AnonymousMicroCacheMiddleware:
+    """
+    Serve GET requests without cookies to the posts pages from a full-page
+    cache kept for POSTS_MICROCACHE_TIMEOUT seconds, so one render answers
+    every identical request of a traffic spike. Pages, redirects (such as
+    to the login page) and 404s are cached if they set no cookies, so
+    concurrent requests never wait for a response that is not stored; any
+    post change starts a new key.
+    """
+
+    CACHEABLE_STATUSES = (200, 301, 302, 404)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = self.cache_key(request)
+        if key is None:
+            return self.get_response(request)
+        return get_or_compute(
+            key,
+            lambda: self.get_response(request),
+            settings.POSTS_MICROCACHE_TIMEOUT,
+            cacheable=self.cacheable,
+            stale_timeout=settings.POSTS_MICROCACHE_TIMEOUT,
+        )
+
+    def cache_key(self, request):
+        if (
+            request.method not in ("GET", "HEAD")
+            or request.COOKIES
+            or "HTTP_IF_NONE_MATCH" in request.META
+            or "HTTP_IF_MODIFIED_SINCE" in request.META
+        ):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if match.namespace != "posts":
+            return None
+        query = sorted(
+            (name, value)
+            for name, value in request.GET.items()
+            if name in settings.POSTS_MICROCACHE_QUERY and value
+            and (name, value) != ("page", "1")
+        )
+        raw = f"{request.path_info}?{urlencode(query)}"
+        return "microcache:{}:{}:{}".format(
+            request.method,
+            hashlib.md5(raw.encode()).hexdigest(),
+            *get_versions("posts"),
+        )
+
+    @classmethod
+    def cacheable(cls, response):
+        return (
+            response.status_code in cls.CACHEABLE_STATUSES
+            and not response.streaming
+            and not response.cookies
+        )
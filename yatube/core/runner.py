@@ -0,0 +1,42 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+def temporary_caches(directory):
+    """CACHES with every file based cache moved into directory."""
+    return {
+        alias: {
+            **config,
+            "LOCATION": os.path.join(
+                directory, os.path.basename(config["LOCATION"])
+            ),
+        }
+        if "LOCATION" in config
+        else config
+        for alias, config in settings.CACHES.items()
+    }
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Run the tests against caches in a temporary directory, so that they
+    neither wipe the cache of the development server nor share it with
+    another test run.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_directory = tempfile.TemporaryDirectory()
+        self.cache_settings = override_settings(
+            CACHES=temporary_caches(self.cache_directory.name)
+        )
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        self.cache_directory.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,18 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.fragments import placeholder, render_fragment
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def fragment(context, template_name, *args):
+    """
+    Include a template that depends on the current user. Pages cached for
+    everyone get a placeholder instead, filled in on every request.
+    """
+    request = context["request"]
+    if getattr(request, "defer_fragments", False):
+        return mark_safe(placeholder(template_name, *args))
+    return render_fragment(request, template_name, *args)
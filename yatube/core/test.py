@@ -1,6 +1,23 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 
-from django.test import Client, TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import (
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+
+from core.cache_backends import SQLiteCache, TieredCache
+from core.middleware import AnonymousMicroCacheMiddleware
 
 
 class ViewTestClass(TestCase):
@@ -9,3 +26,170 @@ class ViewTestClass(TestCase):
         response = self.client.get("/nonexist-page/")
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, "core/404.html")
+
+
+class MicroCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username="author")
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def rendered(self, url, **extra):
+        return self.client.get(url, **extra).context is not None
+
+    def test_anonymous_pages_are_cached(self):
+        self.assertTrue(self.rendered("/"))
+        self.assertFalse(self.rendered("/"))
+        self.assertFalse(self.rendered("/?page=1&utm_source=mail"))
+        self.assertTrue(self.rendered("/?page=2"))
+        self.assertTrue(self.rendered("/about/author/"))
+        self.assertTrue(self.rendered("/about/author/"))
+
+    def test_requests_with_cookies_are_not_cached(self):
+        self.rendered("/")
+        self.client.cookies["sessionid"] = "session"
+        self.assertTrue(self.rendered("/"))
+        self.client.force_login(MicroCacheTest.user)
+        self.assertTrue(self.rendered("/"))
+
+    def test_new_post_is_shown_at_once(self):
+        self.rendered("/")
+        self.user.posts.create(text="new text")
+        self.assertContains(self.client.get("/"), "new text")
+
+    def test_not_found_and_redirects_are_cached(self):
+        for url, status in (("/profile/nobody/", 404), ("/follow/", 302)):
+            with self.subTest(url=url):
+                key = AnonymousMicroCacheMiddleware(None).cache_key(
+                    RequestFactory().get(url)
+                )
+                self.assertEqual(self.client.get(url).status_code, status)
+                response, _ = cache.get(key)
+                self.assertEqual(response.status_code, status)
+
+
+class MicroCacheConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(CACHE_LOCK_TIMEOUT=10)
+    def test_concurrent_requests_do_not_wait_for_lock_timeout(self):
+        def get(url):
+            try:
+                return Client().get(url).status_code
+            finally:
+                connections.close_all()
+
+        for url, status in (("/profile/nobody/", 404), ("/follow/", 302)):
+            with self.subTest(url=url):
+                started = time.monotonic()
+                with ThreadPoolExecutor(max_workers=3) as executor:
+                    statuses = list(executor.map(get, [url] * 3))
+                self.assertEqual(statuses, [status] * 3)
+                self.assertLess(time.monotonic() - started, 2)
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, "cache.sqlite3")
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {"OPTIONS": options})
+
+    def test_entries_are_shared_through_the_file(self):
+        self.make_cache().set("key", {"value": 1})
+        self.assertEqual(self.make_cache().get("key"), {"value": 1})
+
+    def test_expired_entries_are_missing(self):
+        cache = self.make_cache()
+        cache.set("key", "value", -1)
+        self.assertIsNone(cache.get("key"))
+        self.assertTrue(cache.add("key", "new value"))
+        self.assertFalse(cache.add("key", "other value"))
+        self.assertEqual(cache.get("key"), "new value")
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=3)
+        for key in ("a", "b", "c"):
+            cache.set(key, key)
+            cache.execute(
+                "UPDATE cache SET accessed = accessed - ? WHERE key = ?",
+                (10 * (3 - "abc".index(key)), cache.make_key(key)),
+            )
+        cache.get("a")
+        cache.set("d", "d")
+        self.assertEqual(
+            cache.get_many(["a", "b", "c", "d"]).keys(), {"a", "c", "d"}
+        )
+
+    def test_size_cap_is_kept(self):
+        cache = self.make_cache(MAX_SIZE=10_000)
+        for i in range(20):
+            cache.set(f"key{i}", os.urandom(1000))
+        entries, size = cache.execute(
+            "SELECT entries, size FROM cache_stats"
+        ).fetchone()
+        self.assertLessEqual(size, 10_000)
+        stored = cache.get_many([f"key{i}" for i in range(20)])
+        self.assertEqual(entries, len(stored))
+        self.assertIsNotNone(cache.get("key19"))
+
+
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, "changes.sqlite3")
+        self.worker, self.other_worker = (
+            self.make_cache(name) for name in ("worker", "other worker")
+        )
+        self.worker.clear()
+
+    def make_cache(self, name, poll_interval=60):
+        return TieredCache(
+            self.location,
+            {
+                "OPTIONS": {
+                    "L2": "shared",
+                    "POLL_INTERVAL": poll_interval,
+                    "L1_NAME": f"{self.location}:{name}",
+                }
+            },
+        )
+
+    def test_l1_serves_reads_without_l2(self):
+        self.worker.set("key", "value")
+        self.worker.l2.delete("key")
+        self.assertEqual(self.worker.get("key"), "value")
+
+    def test_changes_reach_other_workers_after_poll(self):
+        self.worker.set("key", "old")
+        self.assertEqual(self.other_worker.get("key"), "old")
+        self.worker.set("key", "new")
+        self.assertEqual(self.other_worker.get("key"), "old")
+        self.other_worker.poll_interval = 0
+        self.assertEqual(self.other_worker.get("key"), "new")
+        self.worker.delete("key")
+        self.assertIsNone(self.other_worker.get("key"))
+
+    def test_clear_reaches_other_workers(self):
+        self.other_worker.poll_interval = 0
+        self.worker.set("key", "value")
+        self.assertEqual(self.other_worker.get("key"), "value")
+        self.worker.clear()
+        self.assertIsNone(self.other_worker.get("key"))
+
+    def test_new_thread_does_not_clear_shared_l1(self):
+        self.worker.set("key", "value")
+        self.worker.l2.delete("key")
+        # Django creates a cache instance per thread over the same L1.
+        thread_cache = self.make_cache("worker")
+        self.assertEqual(thread_cache.get("key"), "value")
+        thread_cache.set("other", "value")
+        self.worker.poll_interval = 0
+        self.assertEqual(self.worker.get("key"), "value")
@@ -0,0 +1,76 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from . import lookups
+from .models import Comment, Follow, Group, Post, User, UserCounters
+
+
+def shifted(field, delta):
+    # A counter that drifted to 0 stays there until rebuild_counters.
+    return {field: Greatest(F(field) + delta, 0)}
+
+
+def change(model, pk, field, delta):
+    if pk is not None:
+        model.objects.filter(pk=pk).update(**shifted(field, delta))
+        lookups.forget(model, pk)
+
+
+def change_user(user_id, field, delta):
+    """
+    Atomically shift a user counter. The row is created on the first
+    increment; a missing row on decrement is left for rebuild_counters.
+    """
+    updated = UserCounters.objects.filter(user=user_id).update(
+        **shifted(field, delta)
+    )
+    lookups.forget(User, user_id)
+    if updated or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            UserCounters.objects.create(user_id=user_id, **{field: delta})
+    except IntegrityError:
+        change_user(user_id, field, delta)
+
+
+def user_counters(user):
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        return UserCounters(user=user)
+
+
+def counts_by(queryset, field):
+    return dict(
+        queryset.order_by().values_list(field).annotate(count=Count("pk"))
+    )
+
+
+def drift():
+    """
+    Yield (object, field, stored, actual) for every counter that differs
+    from the live count.
+    """
+    posts_by_group = counts_by(Post.objects.all(), "group")
+    for group in Group.objects.iterator():
+        actual = posts_by_group.get(group.pk, 0)
+        if group.posts_count != actual:
+            yield group, "posts_count", group.posts_count, actual
+    comments_by_post = counts_by(Comment.objects.all(), "post")
+    for post in Post.objects.only("comments_count").iterator():
+        actual = comments_by_post.get(post.pk, 0)
+        if post.comments_count != actual:
+            yield post, "comments_count", post.comments_count, actual
+    actual_counts = {
+        "posts_count": counts_by(Post.objects.all(), "author"),
+        "followers_count": counts_by(Follow.objects.all(), "author"),
+        "following_count": counts_by(Follow.objects.all(), "user"),
+    }
+    for user in User.objects.select_related("counters").iterator():
+        counters = user_counters(user)
+        for field, counts in actual_counts.items():
+            actual = counts.get(user.pk, 0)
+            if getattr(counters, field) != actual:
+                yield counters, field, getattr(counters, field), actual
@@ -0,0 +1,255 @@
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils.functional import cached_property
+
+from core.cache import get_or_compute
+
+from .lookups import object_key
+from .models import Follow, Post, PulledAuthor, TimelineEntry
+from .paginators import NEXT, MergedFeed, QuerySetFeed
+
+# Timeline feeds are ordered by the entry copy of pub_date and post id,
+# which the (user, pub_date, post) index serves without a sort.
+TIMELINE_KEYSET = ("feed_date", "feed_post")
+
+
+def has_followers(author_id, number):
+    """Check for at least number followers without counting all of them."""
+    return (
+        Follow.objects.filter(author=author_id)
+        .order_by()[number - 1:number]
+        .exists()
+    )
+
+
+def is_pulled(author_id):
+    return PulledAuthor.objects.filter(author=author_id).exists()
+
+
+def fan_out(post):
+    """
+    Push a new post into the timelines of its author's followers.
+
+    Posts of pulled authors are read at request time instead, so the work
+    done here is bounded by POSTS_FANOUT_FOLLOWER_LIMIT.
+    """
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(author=post.author_id).values_list(
+        "user_id", flat=True
+    )
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                post=post,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in followers.iterator()
+        ),
+        batch_size=settings.POSTS_TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(follow):
+    """Copy the latest posts of a followed author into a timeline."""
+    posts = Post.objects.filter(author=follow.author_id).order_by(
+        "-pub_date", "-pk"
+    )[:settings.POSTS_TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=follow.user_id,
+                post_id=post_id,
+                author_id=follow.author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts.values_list("pk", "pub_date")
+        ),
+        batch_size=settings.POSTS_TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def remove(follow):
+    TimelineEntry.objects.filter(
+        user=follow.user_id, author=follow.author_id
+    ).delete()
+
+
+def follow_added(follow):
+    if is_pulled(follow.author_id):
+        return
+    if has_followers(follow.author_id, settings.POSTS_FANOUT_FOLLOWER_LIMIT):
+        PulledAuthor.objects.get_or_create(author_id=follow.author_id)
+        return
+    backfill(follow)
+
+
+def authors_to_push():
+    """
+    Pulled authors whose followers fell below half the limit, so that they
+    do not flap between push and pull.
+    """
+    return (
+        PulledAuthor.objects.annotate(followers=Count("author__following"))
+        .filter(followers__lt=settings.POSTS_FANOUT_FOLLOWER_LIMIT // 2)
+        .values_list("author_id", flat=True)
+    )
+
+
+def push_author(author_id):
+    """
+    Switch a pulled author back to push and backfill the timelines of their
+    followers. The work grows with the followers, so it is left to the
+    push_authors command rather than to the unfollow request.
+    """
+    with transaction.atomic():
+        PulledAuthor.objects.filter(author=author_id).delete()
+        for follow in Follow.objects.filter(author=author_id).iterator():
+            backfill(follow)
+
+
+def timeline_posts(user):
+    return (
+        Post.objects.filter(timeline_entries__user=user)
+        .select_related("author", "group")
+        .annotate(
+            feed_date=F("timeline_entries__pub_date"),
+            feed_post=F("timeline_entries__post"),
+        )
+    )
+
+
+def timeline_count_key(user_id):
+    return f"timeline:count:{user_id}"
+
+
+def follow_feed(user):
+    """
+    Feed of followed authors: pushed timeline entries merged with the
+    posts of followed pulled authors.
+    """
+    timeline = QuerySetFeed(
+        timeline_posts(user), TIMELINE_KEYSET, count=user.timeline.count
+    )
+    pulled = list(
+        PulledAuthor.objects.filter(author__following__user=user).values_list(
+            "author_id", flat=True
+        )
+    )
+    if not pulled:
+        return timeline
+    authors = QuerySetFeed(
+        Post.objects.filter(author__in=pulled).select_related(
+            "author", "group"
+        )
+    )
+    return MergedFeed(timeline, authors)
+
+
+def hydrate(ids):
+    """
+    Posts with their author and group for ids, in the same order: one
+    cache.get_many plus one query for the posts missing from the cache.
+    """
+    cached = cache.get_many([object_key(Post, pk) for pk in ids])
+    posts = {post.pk: post for post in cached.values()}
+    missing = [pk for pk in ids if pk not in posts]
+    if missing:
+        fetched = Post.objects.select_related("author", "group").in_bulk(
+            missing
+        )
+        cache.set_many(
+            {object_key(Post, pk): post for pk, post in fetched.items()},
+            settings.POSTS_OBJECT_CACHE_TIMEOUT,
+        )
+        posts.update(fetched)
+    return [posts[pk] for pk in ids if pk in posts]
+
+
+def id_list_key(scope):
+    return f"feed:{scope}"
+
+
+def forget_id_lists(*scopes):
+    keys = [id_list_key(scope) for scope in scopes]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class IdListFeed:
+    """
+    Feed of a scope read through a cached list of its newest
+    POSTS_ID_LIST_LENGTH (pub_date, pk) pairs, newest first. Pages inside
+    the list are hydrated from the post cache, deeper ones are read from
+    queryset.
+
+    The list only changes when posts join or leave the scope, so editing a
+    post drops just that post from the cache.
+    """
+
+    def __init__(self, scope, queryset):
+        self.key = id_list_key(scope)
+        self.queryset = queryset
+        self.fallback = QuerySetFeed(queryset)
+
+    @cached_property
+    def entries(self):
+        return get_or_compute(
+            self.key,
+            lambda: list(
+                self.fallback.queryset.values_list("pub_date", "pk")[
+                    :settings.POSTS_ID_LIST_LENGTH
+                ]
+            ),
+            settings.POSTS_ID_LIST_TIMEOUT,
+        )
+
+    @property
+    def complete(self):
+        return len(self.entries) < settings.POSTS_ID_LIST_LENGTH
+
+    def covers(self, stop):
+        return self.complete or stop <= len(self.entries)
+
+    def __getitem__(self, index):
+        if not self.covers(index.stop):
+            return self.fallback[index]
+        return hydrate([pk for _, pk in self.entries[index]])
+
+    def count(self):
+        if self.complete:
+            return len(self.entries)
+        return self.fallback.count()
+
+    def fetch(self, direction, key, limit):
+        if key is None:
+            if direction == NEXT:
+                return self[:limit]
+            if not self.complete:
+                return self.fallback.fetch(direction, key, limit)
+            start, stop = max(len(self.entries) - limit, 0), None
+        else:
+            ascending = self.entries[::-1]
+            older = bisect_left(ascending, key)
+            newer = len(ascending) - bisect_right(ascending, key)
+            if direction == NEXT:
+                start = len(ascending) - older
+                stop = start + limit
+                if not self.covers(stop):
+                    return self.fallback.fetch(direction, key, limit)
+            else:
+                if not self.complete and key < ascending[0]:
+                    return self.fallback.fetch(direction, key, limit)
+                start, stop = max(newer - limit, 0), newer
+        entries = self.entries[start:stop]
+        if direction != NEXT:
+            entries.reverse()
+        return hydrate([pk for _, pk in entries])
@@ -1,5 +1,9 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
 
+from .images import normalize_image
 from .models import Comment, Post
 
 
@@ -8,6 +12,32 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ("text", "group", "image")
 
+    def clean_image(self):
+        image = self.cleaned_data["image"]
+        if not isinstance(image, UploadedFile):
+            return image
+        # The size comes from the header, nothing has been decoded yet.
+        width, height = image.image.size
+        if width * height > settings.POSTS_UPLOAD_MAX_PIXELS:
+            raise forms.ValidationError(
+                "Картинка слишком большая: не больше %(limit)s "
+                "мегапикселей.",
+                code="too_many_pixels",
+                params={"limit": settings.POSTS_UPLOAD_MAX_PIXELS // 10**6},
+            )
+        try:
+            image = normalize_image(image)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            raise forms.ValidationError(
+                "Не удалось обработать картинку.", code="invalid_image"
+            )
+        if image.size > settings.POSTS_IMAGE_MAX_BYTES:
+            raise forms.ValidationError(
+                "Картинка слишком большая даже после сжатия.",
+                code="too_large",
+            )
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
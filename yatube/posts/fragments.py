@@ -0,0 +1,14 @@
+from core.fragments import provider
+
+from .models import Follow
+
+
+@provider("posts/includes/follow_button.html")
+def follow_button(request, username):
+    following = (
+        request.user.is_authenticated
+        and Follow.objects.filter(
+            user=request.user, author__username=username
+        ).exists()
+    )
+    return {"username": username, "following": following}
@@ -0,0 +1,363 @@
+import base64
+import io
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.cache import cache_lock
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_GEOMETRY = "960x339"
+THUMBNAIL_OPTIONS = {"crop": "center", "upscale": True}
+# The post card is full width up to the 960px column of the layout.
+SIZES = "(max-width: 992px) 100vw, 960px"
+
+# Width of the preview inlined into the post card while the thumbnail loads.
+PLACEHOLDER_WIDTH = 20
+# Uploads in these formats that fit the limits are stored as they are.
+KEPT_FORMATS = ("JPEG", "PNG", "GIF", "WEBP")
+ORIENTATION = 0x0112
+JPEG_QUALITIES = (85, 75, 65)
+
+_executor = None
+
+
+def fitted(size, max_side):
+    width, height = size
+    scale = min(1, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def normalize_image(upload):
+    """
+    Downscale an uploaded image to fit POSTS_IMAGE_MAX_SIDE and re-encode it
+    without metadata: as PNG if it has transparency, otherwise as JPEG at
+    the best of JPEG_QUALITIES that fits POSTS_IMAGE_MAX_BYTES. Uploads that
+    already fit are returned unchanged.
+
+    JPEGs at least twice the target size are decoded straight at the
+    smallest of 1/2, 1/4 or 1/8 of their size that still covers it (draft),
+    and other formats are shrunk by an integer factor (reduce) before the
+    final resampling.
+    """
+    max_side = settings.POSTS_IMAGE_MAX_SIDE
+    upload.seek(0)
+    image = Image.open(upload)
+    if (
+        image.format in KEPT_FORMATS
+        and max(image.size) <= max_side
+        and upload.size <= settings.POSTS_IMAGE_MAX_BYTES
+    ):
+        upload.seek(0)
+        return upload
+    target = fitted(image.size, max_side)
+    image.draft(None, target)
+    factor = min(image.width // target[0], image.height // target[1]) // 2
+    if factor > 1:
+        image = image.reduce(factor)
+    if image.size != target:
+        image = image.resize(target, Image.Resampling.LANCZOS)
+    image = ImageOps.exif_transpose(image)
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    if has_alpha(image):
+        data = encode(image.convert("RGBA"), "PNG", optimize=True)
+        return ContentFile(data, name=f"{stem}.png")
+    image = image.convert("RGB")
+    for quality in JPEG_QUALITIES:
+        data = encode(
+            image, "JPEG", quality=quality, optimize=True, progressive=True
+        )
+        if len(data) <= settings.POSTS_IMAGE_MAX_BYTES:
+            break
+    return ContentFile(data, name=f"{stem}.jpg")
+
+
+def encode(image, image_format, **options):
+    output = io.BytesIO()
+    image.save(output, image_format, **options)
+    return output.getvalue()
+
+
+def describe_image(file):
+    """
+    Return the width and height of an image as displayed, after its EXIF
+    orientation, and a tiny WebP preview of its thumbnail crop as a data URI.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        if image.getexif().get(ORIENTATION) in (5, 6, 7, 8):
+            width, height = height, width
+        size = tuple(map(int, geometry(PLACEHOLDER_WIDTH).split("x")))
+        image.draft("RGB", (size[0] * 4, size[1] * 4))
+        preview = ImageOps.fit(
+            ImageOps.exif_transpose(image).convert("RGB"),
+            size,
+            Image.Resampling.BILINEAR,
+        )
+    data = base64.b64encode(encode(preview, "WEBP", quality=50)).decode()
+    return width, height, f"data:image/webp;base64,{data}"
+
+
+def thumbnail_file(name, geometry=THUMBNAIL_GEOMETRY, **options):
+    """
+    ImageFile that sorl's get_thumbnail would return for name, without
+    opening the source or touching the storage.
+    """
+    backend = default.backend
+    source = ImageFile(name)
+    options = {**THUMBNAIL_OPTIONS, **options}
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault("format", backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    return ImageFile(
+        backend._get_thumbnail_filename(source, geometry, options),
+        default.storage,
+    )
+
+
+def cached_thumbnails(names):
+    """
+    {name: thumbnail} of the images among names whose thumbnail was already
+    generated, read with one get_many from the cache in front of sorl's
+    key-value store and at most one query for the keys it misses.
+    """
+    kvstore = default.kvstore
+    keys = {
+        add_prefix(thumbnail_file(name).key): name for name in set(names)
+        if name
+    }
+    values = kvstore.cache.get_many(list(keys))
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(
+            KVStoreModel.objects.filter(key__in=missing).values_list(
+                "key", "value"
+            )
+        )
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(
+            fetched, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(fetched)
+    return {
+        keys[key]: deserialize_image_file(value)
+        for key, value in values.items()
+        if value != EMPTY_VALUE
+    }
+
+
+def cached_thumbnail(name):
+    """Thumbnail of name if it was already generated, otherwise None."""
+    return cached_thumbnails([name]).get(name)
+
+
+def attach_thumbnails(posts):
+    """
+    Set thumbnail_url on the posts with an image but without recorded
+    variants, from a single cached_thumbnails lookup for all of them, so
+    templates only read URLs.
+    """
+    pending = [
+        post for post in posts if post.image and not post.image_variants
+    ]
+    thumbnails = cached_thumbnails(post.image.name for post in pending)
+    for post in pending:
+        thumbnail = thumbnails.get(post.image.name)
+        post.thumbnail_url = (
+            thumbnail.url if thumbnail is not None else post.image.url
+        )
+
+
+def geometry(width):
+    full_width, full_height = map(int, THUMBNAIL_GEOMETRY.split("x"))
+    return f"{width}x{round(width * full_height / full_width)}"
+
+
+def make_thumbnails(name):
+    """
+    Make a thumbnail of image name for each of POSTS_IMAGE_FORMATS and
+    POSTS_IMAGE_WIDTHS. Return them as {mime type: [[width, name], ...]},
+    or None if the image can not be read.
+    """
+    variants = {}
+    for image_format in settings.POSTS_IMAGE_FORMATS:
+        for width in settings.POSTS_IMAGE_WIDTHS:
+            thumbnail = get_thumbnail(
+                name, geometry(width), format=image_format,
+                **THUMBNAIL_OPTIONS
+            )
+            if default.kvstore.get(thumbnail) is None:
+                return None
+            variants.setdefault(f"image/{image_format.lower()}", []).append(
+                [width, thumbnail.name]
+            )
+    return variants
+
+
+def process_post_image(post_id, name):
+    """
+    Make the thumbnails of a post image, record them on the post and
+    re-render the post card, which showed the original image until then.
+    """
+    variants = make_thumbnails(name)
+    post = Post.objects.filter(pk=post_id, image=name).first()
+    if variants is None or post is None:
+        return False
+    fields = ["image_variants", "updated"]
+    post.image_variants = json.dumps(variants, separators=(",", ":"))
+    if not post.image_placeholder:
+        with post.image.open() as file:
+            (
+                post.image_width,
+                post.image_height,
+                post.image_placeholder,
+            ) = describe_image(file)
+        fields += ["image_width", "image_height", "image_placeholder"]
+    post.save(update_fields=fields)
+    return True
+
+
+def thumbnail_names(variants):
+    if not variants:
+        return []
+    return [
+        name
+        for thumbnails in json.loads(variants).values()
+        for _, name in thumbnails
+    ]
+
+
+def image_lock(name):
+    """
+    Lock of an image file shared by identical uploads: it is deleted and
+    checked by new uploads only under it.
+    """
+    return cache_lock(f"image:{name}")
+
+
+def delete_unused(name, variants=""):
+    try:
+        with image_lock(name):
+            if Post.objects.filter(image=name).exists():
+                return
+            delete(name)
+            # Thumbnails of images moved by relocate_images are recorded
+            # under the old name in sorl's store, so they are deleted by name.
+            for thumbnail in thumbnail_names(variants):
+                default.storage.delete(thumbnail)
+    except Exception:
+        logger.exception("Could not delete image %s", name)
+
+
+def restore_missing(name, content):
+    storage = Post.image.field.storage
+    try:
+        with image_lock(name):
+            if not storage.exists(name):
+                content.seek(0)
+                storage.save(name, content)
+    except Exception:
+        logger.exception("Could not keep image %s", name)
+
+
+def release(name, variants=""):
+    """
+    Delete image name with its thumbnails after the transaction commits, if
+    no post refers to it by then: posts with identical images share a file.
+    """
+    if name:
+        transaction.on_commit(partial(delete_unused, name, variants))
+
+
+def keep(name, content):
+    """
+    Save the upload stored as image name again after the transaction
+    commits, if the release of the last other post with that image deleted
+    the file before the new post was committed.
+    """
+    transaction.on_commit(partial(restore_missing, name, content))
+
+
+def init_worker():
+    # Connections inherited through fork belong to the parent process.
+    for connection in connections.all():
+        connection.connection = None
+
+
+def executor(workers=None):
+    global _executor
+    if workers is not None:
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=init_worker,
+        )
+    if _executor is None:
+        _executor = executor(settings.POSTS_IMAGE_WORKERS)
+    return _executor
+
+
+def log_failure(future):
+    if future.exception() is not None:
+        logger.error(
+            "Thumbnail generation failed", exc_info=future.exception()
+        )
+
+
+def submit(func, *args):
+    global _executor
+    if not settings.POSTS_IMAGE_WORKERS:
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("Thumbnail generation failed")
+        return
+    try:
+        future = executor().submit(func, *args)
+    except BrokenProcessPool:
+        _executor = None
+        future = executor().submit(func, *args)
+    future.add_done_callback(log_failure)
+
+
+def queue_thumbnails(post):
+    """
+    Generate the thumbnails of post.image on the image process pool once the
+    transaction commits. With POSTS_IMAGE_WORKERS = 0 they are generated in
+    the request.
+    """
+    if post.image:
+        transaction.on_commit(
+            partial(submit, process_post_image, post.pk, post.image.name)
+        )
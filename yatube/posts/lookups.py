@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+
+from .models import Group, User
+
+# Natural key field and queryset of every model looked up by natural key.
+LOOKUPS = {
+    User: ("username", lambda: User.objects.select_related("counters")),
+    Group: ("slug", lambda: Group.objects.all()),
+}
+MISSING = "missing"
+
+
+def natural_key(model, value):
+    return f"lookup:{model._meta.label_lower}:{value}"
+
+
+def object_key(model, pk):
+    return f"object:{model._meta.label_lower}:{pk}"
+
+
+def get_cached_or_404(model, value):
+    """
+    Read-through cache of get_object_or_404 by natural key. The natural key
+    maps to the pk and the object is cached under the pk, so counters can
+    drop it without knowing the natural key. Missing objects are cached for
+    POSTS_LOOKUP_MISSING_TIMEOUT seconds.
+    """
+    field, queryset = LOOKUPS[model]
+    key = natural_key(model, value)
+    pk = cache.get(key)
+    if pk == MISSING:
+        raise Http404(f"No {model._meta.object_name} matches the query.")
+    obj = None if pk is None else cache.get(object_key(model, pk))
+    if obj is None:
+        obj = queryset().filter(**{field: value}).first()
+        if obj is None:
+            cache.set(key, MISSING, settings.POSTS_LOOKUP_MISSING_TIMEOUT)
+            raise Http404(f"No {model._meta.object_name} matches the query.")
+        cache.set_many(
+            {key: obj.pk, object_key(model, obj.pk): obj},
+            settings.POSTS_LOOKUP_CACHE_TIMEOUT,
+        )
+    return obj
+
+
+def forget(model, pk, *values):
+    """
+    Drop the cached object and its natural keys, old and new, now and once
+    more after the transaction commits.
+    """
+    keys = [natural_key(model, value) for value in values if value]
+    keys.append(object_key(model, pk))
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
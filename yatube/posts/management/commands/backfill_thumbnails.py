@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from posts.images import executor, process_post_image
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Создаёт недостающие миниатюры картинок всех постов."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Число процессов, 0 - без дочерних процессов.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=16)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        posts = (
+            Post.objects.exclude(image="")
+            .filter(Q(image_variants="") | Q(image_placeholder=""))
+            .values_list("pk", "image")
+        )
+        pks = [pk for pk, _ in posts]
+        names = [name for _, name in posts]
+        if options["workers"]:
+            with executor(options["workers"]) as pool:
+                results = list(
+                    pool.map(
+                        process_post_image,
+                        pks,
+                        names,
+                        chunksize=options["chunk_size"],
+                    )
+                )
+        else:
+            results = list(map(process_post_image, pks, names))
+        failed = [name for name, ready in zip(names, results) if not ready]
+        for name in failed:
+            self.stderr.write(f"Не удалось создать миниатюры: {name}")
+        self.stdout.write(
+            f"Обработано картинок: {len(names)}, с ошибками: "
+            f"{len(failed)} за {time.perf_counter() - started:.1f} s"
+        )
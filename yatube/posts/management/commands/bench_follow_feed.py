@@ -0,0 +1,85 @@
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.feeds import follow_feed
+from posts.models import Follow, Post, TimelineEntry, User
+from posts.paginators import FeedPaginator
+from posts.views import POSTS_ON_PAGE
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает ленту подписок через JOIN по Follow с чтением "
+        "из таймлайна. Данные создаются в транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--followees", type=int, default=10_000)
+        parser.add_argument("--posts-per-author", type=int, default=3)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            reader = self.populate(
+                options["followees"], options["posts_per_author"]
+            )
+            feeds = {
+                "join": FeedPaginator(
+                    Post.objects.filter(author__following__user=reader),
+                    POSTS_ON_PAGE,
+                ),
+                "timeline": FeedPaginator(follow_feed(reader), POSTS_ON_PAGE),
+            }
+            for name, paginator in feeds.items():
+                timings = self.measure(paginator, options["repeat"])
+                self.stdout.write(
+                    f"{name:>8}: median {statistics.median(timings):.2f} ms, "
+                    f"max {max(timings):.2f} ms"
+                )
+            transaction.set_rollback(True)
+
+    def populate(self, followees, posts_per_author):
+        prefix = f"bench_{uuid.uuid4().hex[:8]}_"
+        User.objects.bulk_create(
+            User(username=f"{prefix}{i}") for i in range(followees + 1)
+        )
+        reader, *authors = User.objects.filter(
+            username__startswith=prefix
+        ).order_by("pk")
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author) for author in authors
+        )
+        Post.objects.bulk_create(
+            Post(author=author, text=f"bench post {i}")
+            for author in authors
+            for i in range(posts_per_author)
+        )
+        posts = Post.objects.filter(author__in=authors).values_list(
+            "pk", "author_id", "pub_date"
+        )
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user=reader,
+                    post_id=pk,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for pk, author_id, pub_date in posts.iterator()
+            ),
+            batch_size=500,
+        )
+        return reader
+
+    def measure(self, paginator, repeat):
+        timings = []
+        for _ in range(repeat):
+            paginator.__dict__.pop("count", None)
+            started = time.perf_counter()
+            list(paginator.page(1))
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
@@ -0,0 +1,56 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит картинки постов по адресу их содержимого: одинаковые "
+        "файлы объединяются, старые удаляются, миниатюры создаются заново."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Число процессов для создания миниатюр.",
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field("image").storage
+        names = (
+            Post.objects.exclude(image="")
+            .order_by()
+            .values_list("image", flat=True)
+            .distinct()
+        )
+        renamed, missing = {}, []
+        for name in names:
+            if not storage.exists(name):
+                missing.append(name)
+                continue
+            with storage.open(name) as content:
+                new_name = storage.save(name, content)
+            if new_name == name:
+                continue
+            renamed[name] = new_name
+            # Saving post by post lets the signals invalidate the caches and
+            # delete the old file once no post refers to it.
+            for post in Post.objects.filter(image=name):
+                post.image = new_name
+                post.save(update_fields=["image", "image_variants", "updated"])
+        for name in missing:
+            self.stderr.write(f"Файл не найден: {name}")
+        self.stdout.write(
+            f"Перенесено файлов: {len(renamed)}, "
+            f"осталось: {len(set(renamed.values()))}"
+        )
+        if renamed:
+            call_command(
+                "backfill_thumbnails",
+                workers=options["workers"],
+                stdout=self.stdout,
+                stderr=self.stderr,
+            )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.feeds import authors_to_push, push_author
+
+
+class Command(BaseCommand):
+    help = (
+        "Возвращает к рассылке в ленты авторов, у которых осталось меньше "
+        "половины порога подписчиков, и заполняет ленты их подписчиков."
+    )
+
+    def handle(self, *args, **options):
+        authors = list(authors_to_push())
+        for author_id in authors:
+            push_author(author_id)
+        self.stdout.write(f"Авторов возвращено к рассылке: {len(authors)}")
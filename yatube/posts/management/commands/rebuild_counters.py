@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.counters import drift
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет счётчики постов, комментариев и подписок с фактическими "
+        "значениями и исправляет расхождения."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только показать расхождения, ничего не меняя.",
+        )
+
+    def handle(self, *args, **options):
+        found = 0
+        for obj, field, stored, actual in drift():
+            found += 1
+            self.stdout.write(
+                f"{obj._meta.model_name} {obj.pk} {field}: "
+                f"{stored} -> {actual}"
+            )
+            if not options["check"]:
+                setattr(obj, field, actual)
+                obj.save(
+                    update_fields=None if obj._state.adding else [field]
+                )
+        if options["check"] and found:
+            raise CommandError(f"Найдено расхождений: {found}")
+        self.stdout.write(f"Расхождений: {found}")
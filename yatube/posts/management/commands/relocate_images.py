@@ -0,0 +1,101 @@
+import hashlib
+import os
+import shutil
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import bump_versions
+from posts.lookups import object_key
+from posts.models import Post
+from posts.storage import content_digest, unsharded
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит картинки постов в подкаталоги posts/ab/cd/ пачками, не "
+        "останавливая сайт: файл сначала появляется по новому пути, затем "
+        "меняются пути в постах, и только потом удаляется старый файл."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Пауза между пачками в секундах.",
+        )
+
+    def handle(self, *args, **options):
+        self.storage = Post._meta.get_field("image").storage
+        moved = missing = 0
+        last = ""
+        while True:
+            names = list(
+                Post.objects.filter(image__gt=last)
+                .order_by("image")
+                .values_list("image", flat=True)
+                .distinct()[:options["batch_size"]]
+            )
+            if not names:
+                break
+            last = names[-1]
+            for name in names:
+                if unsharded(name) != name:
+                    continue
+                if not self.storage.exists(name):
+                    self.stderr.write(f"Файл не найден: {name}")
+                    missing += 1
+                    continue
+                self.relocate(name)
+                moved += 1
+            self.stdout.write(f"Перенесено файлов: {moved}, до {last}")
+            time.sleep(options["sleep"])
+        self.stdout.write(
+            f"Готово. Перенесено файлов: {moved}, не найдено: {missing}"
+        )
+
+    def relocate(self, name):
+        digest = content_digest(name) or self.hash(name)
+        new_name = self.storage.content_name(name, digest)
+        self.copy(name, new_name)
+        with transaction.atomic():
+            posts = Post.objects.filter(image=name)
+            rows = list(
+                posts.values_list("pk", "author__username", "group__slug")
+            )
+            # The thumbnails in image_variants do not depend on the path of
+            # the original, so they are kept.
+            posts.update(image=new_name, updated=timezone.now())
+        cache.delete_many([object_key(Post, pk) for pk, _, _ in rows])
+        bump_versions(
+            "posts",
+            *{f"post:{pk}" for pk, _, _ in rows},
+            *{f"author:{username}" for _, username, _ in rows},
+            *{f"group:{slug}" for _, _, slug in rows if slug},
+        )
+        if not Post.objects.filter(image=name).exists():
+            self.storage.delete(name)
+
+    def hash(self, name):
+        digest = hashlib.sha256()
+        with self.storage.open(name) as content:
+            for chunk in content.chunks():
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def copy(self, name, new_name):
+        if self.storage.exists(new_name):
+            return
+        source, target = self.storage.path(name), self.storage.path(new_name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temporary = f"{target}.part"
+        try:
+            os.link(source, temporary)
+        except OSError:
+            shutil.copyfile(source, temporary)
+        os.replace(temporary, target)
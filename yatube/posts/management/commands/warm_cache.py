@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.warming import warm_cache, warm_urls
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет кэш лент и постов: первые страницы главной, страницы "
+        "всех групп и профили авторов с наибольшим числом постов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pages", type=int, help="Сколько страниц главной прогреть."
+        )
+        parser.add_argument(
+            "--authors", type=int, help="Сколько профилей авторов прогреть."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, help="Число потоков."
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        results = warm_cache(
+            warm_urls(options["pages"], options["authors"]),
+            options["concurrency"],
+        )
+        for url, status, elapsed in results:
+            self.stdout.write(f"{status} {elapsed:8.1f} ms {url}")
+        self.stdout.write(
+            f"Прогрето страниц: {len(results)} за "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms"
+        )
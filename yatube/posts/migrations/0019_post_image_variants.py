@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0018_post_updated"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="image_variants",
+            field=models.TextField(
+                blank=True,
+                default="",
+                editable=False,
+                verbose_name="миниатюры картинки",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:25
+
+from django.db import migrations, models
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0019_post_image_variants"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="post",
+            name="image",
+            field=models.ImageField(
+                blank=True,
+                db_index=True,
+                help_text="выберите изображение для загрузки",
+                storage=posts.storage.ContentAddressedStorage(),
+                upload_to="posts/",
+                verbose_name="Картинка",
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0020_post_image_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="image_height",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="высота картинки"
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="image_placeholder",
+            field=models.TextField(
+                blank=True, default="", editable=False, verbose_name="превью картинки"
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="image_width",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="ширина картинки"
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-18 21:40
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def pull_popular_authors(apps, schema_editor):
+    Follow = apps.get_model("posts", "Follow")
+    PulledAuthor = apps.get_model("posts", "PulledAuthor")
+    authors = (
+        Follow.objects.order_by()
+        .values("author")
+        .annotate(followers=Count("pk"))
+        .filter(followers__gte=settings.POSTS_FANOUT_FOLLOWER_LIMIT)
+        .values_list("author", flat=True)
+    )
+    PulledAuthor.objects.bulk_create(
+        (PulledAuthor(author_id=author_id) for author_id in authors),
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0021_post_image_placeholder"),
+    ]
+
+    operations = [
+        migrations.RunPython(pull_popular_authors, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,40 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
-class Group(models.Model):
+class CountedModel(models.Model):
+    """
+    Model with denormalized counters that only counters.change writes, with
+    F() updates: saves of an existing row leave them out, so an instance
+    loaded before a counter changed does not write the old value back.
+    """
+
+    counter_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not args
+            and not kwargs.get("force_insert")
+            and kwargs.get("update_fields") is None
+        ):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Group(CountedModel):
     title = models.CharField(
         "Название группы", max_length=200, help_text="Напишите название группы"
     )
@@ -17,14 +47,20 @@ class Group(models.Model):
     description = models.TextField(
         "Описание группы", help_text="Напишите описание группы"
     )
+    posts_count = models.PositiveIntegerField(
+        "Количество постов", default=0, editable=False
+    )
+
+    counter_fields = ("posts_count",)
 
     def __str__(self):
         return self.title
 
 
-class Post(models.Model):
+class Post(CountedModel):
     text = models.TextField("Текст поста", help_text="Напишите текст поста")
     pub_date = models.DateTimeField("дата публикации", auto_now_add=True)
+    updated = models.DateTimeField("дата изменения", auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -43,12 +79,40 @@ class Post(models.Model):
     image = models.ImageField(
         "Картинка",
         upload_to="posts/",
+        storage=ContentAddressedStorage(),
         blank=True,
+        db_index=True,
         help_text="выберите изображение для загрузки",
     )
+    image_variants = models.TextField(
+        "миниатюры картинки", blank=True, default="", editable=False
+    )
+    image_width = models.PositiveIntegerField(
+        "ширина картинки", null=True, blank=True, editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        "высота картинки", null=True, blank=True, editable=False
+    )
+    image_placeholder = models.TextField(
+        "превью картинки", blank=True, default="", editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        "количество комментариев", default=0, editable=False
+    )
+
+    counter_fields = ("comments_count",)
 
     class Meta:
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(fields=["pub_date"], name="post_pub_date_idx"),
+            models.Index(
+                fields=["group", "pub_date"], name="post_group_pub_date_idx"
+            ),
+            models.Index(
+                fields=["author", "pub_date"], name="post_author_pub_date_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -70,6 +134,13 @@ class Comment(models.Model):
     text = models.TextField("комментарий", help_text="оставьте комментарий")
     created = models.DateTimeField("дата публикации", auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["post", "created"], name="comment_post_created_idx"
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -91,3 +162,75 @@ class Follow(models.Model):
                 fields=["user", "author"], name="unique following"
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["author", "user"], name="follow_author_user_idx"
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+        verbose_name="Читатель",
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name="пост",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Автор",
+    )
+    pub_date = models.DateTimeField("дата публикации")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"], name="unique timeline entry"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "pub_date", "post"],
+                name="timeline_user_pub_date_idx",
+            ),
+            models.Index(
+                fields=["user", "author"], name="timeline_user_author_idx"
+            ),
+        ]
+
+
+class PulledAuthor(models.Model):
+    """Author with too many followers to push posts into their timelines."""
+
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="pulled_feed",
+        verbose_name="Автор",
+    )
+
+
+class UserCounters(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="counters",
+        verbose_name="Пользователь",
+    )
+    posts_count = models.PositiveIntegerField("Количество постов", default=0)
+    followers_count = models.PositiveIntegerField(
+        "Количество подписчиков", default=0
+    )
+    following_count = models.PositiveIntegerField(
+        "Количество подписок", default=0
+    )
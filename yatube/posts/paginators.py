@@ -0,0 +1,265 @@
+import base64
+import heapq
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.timezone import is_naive
+
+from core.cache import get_or_compute
+
+NEXT = "n"
+PREVIOUS = "p"
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(direction, post=None):
+    key = [post.pub_date.isoformat(), post.pk] if post is not None else None
+    raw = json.dumps([direction, key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        direction, key = json.loads(raw.decode())
+        if key is not None:
+            pub_date, pk = parse_datetime(key[0]), int(key[1])
+            # Feeds compare keys with aware pub_dates.
+            if pub_date is None or is_naive(pub_date):
+                raise ValueError
+            key = (pub_date, pk)
+    except (KeyError, IndexError, TypeError, ValueError):
+        raise InvalidCursor(token)
+    if direction not in (NEXT, PREVIOUS):
+        raise InvalidCursor(token)
+    return direction, key
+
+
+class CursorPage(Page):
+    """Page fetched by a keyset cursor: it has no number and no count."""
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return "<Page by cursor>"
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class QuerySetFeed:
+    """
+    Post queryset read newest first in keyset order.
+
+    keyset names the lookups that mirror post.pub_date and post.pk in the
+    queryset.
+    """
+
+    def __init__(self, queryset, keyset=("pub_date", "pk"), count=None):
+        self.keyset = keyset
+        self.queryset = queryset.order_by(*("-" + field for field in keyset))
+        self.count_source = count
+
+    def __getitem__(self, index):
+        return self.queryset[index]
+
+    def count(self):
+        if self.count_source is not None:
+            return self.count_source()
+        return self.queryset.count()
+
+    def fetch(self, direction, key, limit):
+        """
+        Return up to limit posts past key: older ones newest first for NEXT,
+        newer ones oldest first for PREVIOUS.
+        """
+        date_field, pk_field = self.keyset
+        posts = self.queryset
+        if direction == PREVIOUS:
+            posts = posts.reverse()
+        if key is not None:
+            lookup = "gt" if direction == PREVIOUS else "lt"
+            posts = posts.filter(
+                Q(**{f"{date_field}__{lookup}": key[0]})
+                | Q(**{date_field: key[0], f"{pk_field}__{lookup}": key[1]})
+            )
+        return list(posts[:limit])
+
+
+class MergedFeed:
+    """K-way merge of several feeds on (pub_date, pk), without duplicates."""
+
+    def __init__(self, *feeds):
+        self.feeds = feeds
+
+    def __getitem__(self, index):
+        stop = index.stop
+        merged = self.merge(list(feed[:stop]) for feed in self.feeds)
+        return list(islice(merged, index.start, stop))
+
+    def count(self):
+        return sum(feed.count() for feed in self.feeds)
+
+    def fetch(self, direction, key, limit):
+        merged = self.merge(
+            (feed.fetch(direction, key, limit) for feed in self.feeds),
+            newest_first=direction == NEXT,
+        )
+        return list(islice(merged, limit))
+
+    @staticmethod
+    def merge(sources, newest_first=True):
+        seen = set()
+        for post in heapq.merge(
+            *sources,
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=newest_first,
+        ):
+            if post.pk not in seen:
+                seen.add(post.pk)
+                yield post
+
+
+class FeedPaginator(Paginator):
+    """
+    Paginator for post feeds ordered by (pub_date, pk), newest first.
+
+    The first max_numbered_page pages are addressed by number, deeper pages
+    are fetched by opaque cursors, so their cost does not depend on depth.
+    object_list is a feed (QuerySetFeed, MergedFeed) or a post queryset,
+    which is wrapped into a QuerySetFeed.
+
+    The total is taken from count (a number or a callable) when given,
+    otherwise from the cache under count_key, refreshed at most every
+    POSTS_COUNT_CACHE_TIMEOUT seconds, and only falls back to a live
+    COUNT(*) without either.
+    """
+
+    ELLIPSIS = "…"
+
+    def __init__(self, object_list, per_page, max_numbered_page=None,
+                 count=None, count_key=None, **kwargs):
+        if not hasattr(object_list, "fetch"):
+            object_list = QuerySetFeed(object_list)
+        self.count_source = count
+        self.count_key = count_key
+        self.max_numbered_page = (
+            max_numbered_page or settings.POSTS_MAX_NUMBERED_PAGE
+        )
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        if callable(self.count_source):
+            return self.count_source()
+        if self.count_source is not None:
+            return self.count_source
+        if self.count_key is None:
+            return super().count
+        return get_or_compute(
+            self.count_key,
+            lambda: self.object_list.count(),
+            settings.POSTS_COUNT_CACHE_TIMEOUT,
+        )
+
+    @property
+    def last_numbered_page(self):
+        return min(self.num_pages, self.max_numbered_page)
+
+    @property
+    def has_deep_pages(self):
+        return self.num_pages > self.max_numbered_page
+
+    @property
+    def last_cursor(self):
+        return encode_cursor(PREVIOUS)
+
+    def validate_number(self, number):
+        number = super().validate_number(number)
+        if number > self.max_numbered_page:
+            raise EmptyPage("That page is only reachable by cursor")
+        return number
+
+    def get_page(self, number):
+        try:
+            number = self.validate_number(number)
+        except PageNotAnInteger:
+            number = 1
+        except EmptyPage:
+            number = self.last_numbered_page
+        return self.page(number)
+
+    def get_elided_page_range(self, number=1, *, on_each_side=3, on_ends=2):
+        """Backport of the Django 3.2 method bounded by numbered pages."""
+        number = self.validate_number(number)
+        last = self.last_numbered_page
+        if last <= (on_each_side + on_ends) * 2:
+            yield from range(1, last + 1)
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < last - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(last - on_ends + 1, last + 1)
+        else:
+            yield from range(number + 1, last + 1)
+
+    def page_from_request(self, request):
+        cursor = request.GET.get("cursor")
+        if cursor:
+            try:
+                page = self.cursor_page(cursor)
+            except InvalidCursor:
+                pass
+            else:
+                if page:
+                    return page
+        return self.get_page(request.GET.get("page"))
+
+    def cursor_page(self, token):
+        direction, key = decode_cursor(token)
+        posts = self.object_list.fetch(direction, key, self.per_page + 1)
+        has_more = len(posts) > self.per_page
+        posts = posts[:self.per_page]
+        if not posts:
+            return CursorPage(posts, self, None, None)
+        if direction == PREVIOUS:
+            posts.reverse()
+            newer, older = has_more, key is not None
+        else:
+            newer, older = key is not None, has_more
+        return CursorPage(
+            posts,
+            self,
+            next_cursor=encode_cursor(NEXT, posts[-1]) if older else None,
+            previous_cursor=(
+                encode_cursor(PREVIOUS, posts[0]) if newer else None
+            ),
+        )
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        page.next_cursor = page.previous_cursor = None
+        page.page_range = list(self.get_elided_page_range(page.number))
+        if page.number == self.max_numbered_page and page.has_next():
+            page.next_cursor = encode_cursor(NEXT, page[len(page) - 1])
+        return page
@@ -0,0 +1,312 @@
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image
+
+from core.cache import bump_versions
+
+from . import counters, feeds, images, lookups
+from .models import Comment, Follow, Group, Post, User, UserCounters
+
+# Fields of users and groups shown on post cards.
+CARD_FIELDS = {
+    User: ("username", "first_name", "last_name"),
+    Group: ("slug",),
+}
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        feeds.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        feeds.follow_added(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_timeline(sender, instance, **kwargs):
+    feeds.remove(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    instance.saved_group_id, instance.saved_image = None, ""
+    instance.saved_image_variants = ""
+    if not instance._state.adding:
+        (
+            instance.saved_group_id,
+            instance.saved_image,
+            instance.saved_image_variants,
+        ) = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list("group_id", "image", "image_variants")
+            .first()
+        ) or (None, "", "")
+        if instance.saved_image != instance.image.name:
+            instance.image_variants = ""
+
+
+@receiver(pre_save, sender=Post)
+def remember_upload(sender, instance, **kwargs):
+    instance.uploaded_image = (
+        None if instance.image._committed else instance.image.file
+    )
+
+
+@receiver(pre_save, sender=Post)
+def describe_post_image(sender, instance, **kwargs):
+    if instance.image.name == instance.saved_image:
+        return
+    instance.image_width = instance.image_height = None
+    instance.image_placeholder = ""
+    if not instance.image:
+        return
+    try:
+        (
+            instance.image_width,
+            instance.image_height,
+            instance.image_placeholder,
+        ) = images.describe_image(instance.image)
+    except (OSError, SuspiciousFileOperation, Image.DecompressionBombError):
+        pass
+    finally:
+        # A new upload stays open for the field to save it.
+        if instance.image._committed:
+            instance.image.close()
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, "posts_count", 1)
+        counters.change(Group, instance.group_id, "posts_count", 1)
+    elif instance.saved_group_id != instance.group_id:
+        counters.change(Group, instance.saved_group_id, "posts_count", -1)
+        counters.change(Group, instance.group_id, "posts_count", 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, "posts_count", -1)
+    counters.change(Group, instance.group_id, "posts_count", -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change(Post, instance.post_id, "comments_count", 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change(Post, instance.post_id, "comments_count", -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, "followers_count", 1)
+        counters.change_user(instance.user_id, "following_count", 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, "followers_count", -1)
+    counters.change_user(instance.user_id, "following_count", -1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_versions(sender, instance, **kwargs):
+    group_ids = {instance.group_id, getattr(instance, "saved_group_id", None)}
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        "slug", flat=True
+    )
+    bump_versions(
+        "posts",
+        f"post:{instance.pk}",
+        f"author:{instance.author.username}",
+        *(f"group:{slug}" for slug in slugs),
+    )
+    if kwargs.get("created", True):
+        cache.delete("posts:count:all")
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_versions(sender, instance, **kwargs):
+    bump_versions(f"post:{instance.post_id}")
+
+
+def group_authors(group):
+    return list(
+        User.objects.filter(posts__group=group)
+        .values_list("username", flat=True)
+        .distinct()
+    )
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_authors(sender, instance, **kwargs):
+    # Posts lose their group before post_delete.
+    instance.saved_authors = group_authors(instance)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_group_versions(sender, instance, created=False, **kwargs):
+    # Profiles link to the groups of their posts.
+    authors = getattr(instance, "saved_authors", None)
+    if authors is None:
+        authors = [] if created else group_authors(instance)
+    bump_versions(
+        "posts",
+        f"group:{instance.slug}",
+        *(f"author:{username}" for username in authors),
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_follow_versions(sender, instance, **kwargs):
+    bump_versions(
+        f"author:{instance.author.username}",
+        f"author:{instance.user.username}",
+    )
+    cache.delete(feeds.timeline_count_key(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def bump_user_versions(sender, instance, created, **kwargs):
+    if created or not card_changed(sender, instance):
+        return
+    # Group pages show the names of the authors of their posts.
+    slugs = (
+        Group.objects.filter(posts__author=instance)
+        .values_list("slug", flat=True)
+        .distinct()
+    )
+    bump_versions(
+        "posts",
+        f"author:{instance.username}",
+        *(f"group:{slug}" for slug in slugs),
+    )
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Group)
+def remember_card_fields(sender, instance, update_fields=None, **kwargs):
+    field, _ = lookups.LOOKUPS[sender]
+    fields = CARD_FIELDS[sender]
+    instance.saved_natural_key = instance.saved_card_fields = None
+    if not instance._state.adding and (
+        update_fields is None or set(fields) & set(update_fields)
+    ):
+        instance.saved_card_fields = (
+            sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+        )
+        if instance.saved_card_fields is not None:
+            instance.saved_natural_key = instance.saved_card_fields[
+                fields.index(field)
+            ]
+
+
+def card_changed(sender, instance):
+    saved = getattr(instance, "saved_card_fields", None)
+    return saved is not None and saved != tuple(
+        getattr(instance, field) for field in CARD_FIELDS[sender]
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Group)
+def forget_natural_key(sender, instance, **kwargs):
+    field, _ = lookups.LOOKUPS[sender]
+    lookups.forget(
+        sender,
+        instance.pk,
+        getattr(instance, field),
+        getattr(instance, "saved_natural_key", None),
+    )
+
+
+@receiver(post_save, sender=UserCounters)
+def forget_user_counters(sender, instance, **kwargs):
+    lookups.forget(User, instance.user_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def forget_cached_post(sender, instance, **kwargs):
+    lookups.forget(Post, instance.pk)
+    saved_group_id = getattr(instance, "saved_group_id", None)
+    if kwargs.get("created", True) or saved_group_id != instance.group_id:
+        feeds.forget_id_lists(
+            "posts",
+            f"author:{instance.author_id}",
+            *(
+                f"group:{group_id}"
+                for group_id in {instance.group_id, saved_group_id}
+                if group_id is not None
+            ),
+        )
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, created, **kwargs):
+    if not created and instance.saved_image != instance.image.name:
+        images.release(
+            instance.saved_image, instance.saved_image_variants
+        )
+
+
+@receiver(post_save, sender=Post)
+def keep_uploaded_image(sender, instance, **kwargs):
+    if instance.uploaded_image is not None:
+        images.keep(instance.image.name, instance.uploaded_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    images.release(instance.image.name, instance.image_variants)
+
+
+def forget_posts(posts):
+    """
+    Touch updated of posts and drop them from the cache, now and once more
+    after the transaction commits, so their cards render again.
+    """
+    pks = list(posts.values_list("pk", flat=True))
+    keys = [lookups.object_key(Post, pk) for pk in pks]
+    posts.update(updated=timezone.now())
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+def forget_cached_posts(sender, instance, created, **kwargs):
+    if created or not card_changed(sender, instance):
+        return
+    field = "author" if sender is User else "group"
+    forget_posts(Post.objects.filter(**{field: instance}))
+
+
+@receiver(pre_delete, sender=Group)
+def forget_group_posts(sender, instance, **kwargs):
+    # SET_NULL clears the group of the posts without their signals.
+    forget_posts(Post.objects.filter(group=instance))
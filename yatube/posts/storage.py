@@ -0,0 +1,82 @@
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+def unsharded(name):
+    """posts/ab/cd/abcd….png -> posts/abcd….png, other names unchanged."""
+    parts = name.split("/")
+    if (
+        len(parts) >= 3
+        and parts[-3] == parts[-1][:2]
+        and parts[-2] == parts[-1][2:4]
+    ):
+        return "/".join(parts[:-3] + parts[-1:])
+    return name
+
+
+def content_digest(name):
+    """SHA-256 a content-addressed name was saved under, else None."""
+    stem = os.path.splitext(posixpath.basename(name))[0]
+    return stem if DIGEST.fullmatch(stem) else None
+
+
+class HashedContent:
+    """Content wrapper that hashes the chunks as the storage streams them."""
+
+    def __init__(self, content):
+        self.content = content
+        self.hash = hashlib.sha256()
+
+    def chunks(self):
+        for chunk in self.content.chunks():
+            self.hash.update(chunk)
+            yield chunk
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that saves a file under the SHA-256 of its content
+    in the directory it is uploaded to, so identical uploads share one file
+    and one set of thumbnails. Files are spread over two levels of
+    subdirectories named by the first hex digits of the hash, as in
+    posts/ab/cd/abcd….png, to keep directories small.
+
+    The content is streamed to a temporary file while it is hashed, which is
+    then renamed to its content address, or dropped when that exists.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def content_name(self, name, digest):
+        directory, basename = posixpath.split(unsharded(name))
+        extension = os.path.splitext(basename)[1].lower()
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        )
+
+    def _save(self, name, content):
+        hashed = HashedContent(content)
+        temporary = super()._save(
+            posixpath.join(
+                posixpath.dirname(name), f".{uuid.uuid4().hex}.part"
+            ),
+            hashed,
+        )
+        name = self.content_name(name, hashed.hash.hexdigest())
+        if self.exists(name):
+            os.remove(self.path(temporary))
+        else:
+            os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+            os.replace(self.path(temporary), self.path(name))
+        return name
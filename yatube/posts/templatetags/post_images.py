@@ -0,0 +1,62 @@
+import json
+
+from django import template
+from sorl.thumbnail import default
+
+from ..images import SIZES, THUMBNAIL_GEOMETRY, cached_thumbnail
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail_url(image):
+    """
+    URL of the generated thumbnail of image, or of the original while the
+    image pool has not made it yet: templates never resize images.
+    """
+    if not image:
+        return ""
+    thumbnail = cached_thumbnail(image.name)
+    return thumbnail.url if thumbnail is not None else image.url
+
+
+def srcset(variants):
+    return ", ".join(
+        f"{default.storage.url(name)} {width}w" for width, name in variants
+    )
+
+
+@register.inclusion_tag("posts/includes/post_image.html")
+def post_image(post):
+    """
+    <picture> with a source per format of the thumbnails recorded on post,
+    or the single thumbnail image before they are made, as attached by
+    attach_thumbnails in the views. The img has the intrinsic size of what
+    it shows and the preview of post as background until it loads.
+    """
+    width, height = map(int, THUMBNAIL_GEOMETRY.split("x"))
+    context = {
+        "width": width,
+        "height": height,
+        "placeholder": post.image_placeholder,
+    }
+    if not post.image_variants:
+        src = getattr(post, "thumbnail_url", None) or thumbnail_url(
+            post.image
+        )
+        if src == post.image.url:
+            context.update(width=post.image_width, height=post.image_height)
+        return {**context, "src": src}
+    *sources, (fallback_type, fallback) = json.loads(
+        post.image_variants
+    ).items()
+    return {
+        **context,
+        "sources": [
+            {"type": mime_type, "srcset": srcset(variants)}
+            for mime_type, variants in sources
+        ],
+        "src": default.storage.url(fallback[-1][1]),
+        "srcset": srcset(fallback),
+        "sizes": SIZES,
+    }
@@ -1,8 +1,17 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.test import Client, SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+
+from core.cache import bump_versions, get_or_compute, jittered
 
-from ..models import Post, User
+from ..feeds import hydrate, id_list_key
+from ..lookups import object_key
+from ..models import Comment, Group, Post, User
 
 
 class TestPostsCache(TestCase):
@@ -10,20 +19,336 @@ class TestPostsCache(TestCase):
     def setUpClass(cls):
         super().setUpClass()
         cls.user = User.objects.create(username="author")
+        cls.group = Group.objects.create(
+            title="test title", slug="test-slug", description="description"
+        )
+        cls.other_group = Group.objects.create(
+            title="other title", slug="other-slug", description="description"
+        )
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.client.force_login(TestPostsCache.user)
-        Post.objects.create(author=TestPostsCache.user, text="test text")
+        self.post = Post.objects.create(
+            author=TestPostsCache.user, text="test text"
+        )
 
-    def test_index_page_cached(self):
+    def test_index_posts_cached(self):
         response_1 = self.client.get(reverse("posts:index"))
-        content_1 = response_1.content
-        Post.objects.all().delete()
+        Post.objects.update(text="changed without signals")
         response_2 = self.client.get(reverse("posts:index"))
-        content_2 = response_2.content
-        self.assertEqual(content_1, content_2)
-        cache.clear()
+        self.assertEqual(response_1.content, response_2.content)
+
+    def test_post_changes_invalidate_index_immediately(self):
+        response_1 = self.client.get(reverse("posts:index"))
+        self.post.delete()
+        response_2 = self.client.get(reverse("posts:index"))
+        self.assertNotEqual(response_1.content, response_2.content)
+        Post.objects.create(author=TestPostsCache.user, text="new text")
         response_3 = self.client.get(reverse("posts:index"))
-        content_3 = response_3.content
-        self.assertNotEqual(content_1, content_3)
+        self.assertContains(response_3, "new text")
+
+    def test_edit_invalidates_only_the_post(self):
+        other_post = Post.objects.create(
+            author=TestPostsCache.user, text="other text"
+        )
+        self.client.get(reverse("posts:index"))
+        self.client.post(
+            reverse("posts:post_edit", args=[self.post.pk]),
+            {"text": "edited text"},
+        )
+        self.assertIsNotNone(cache.get(id_list_key("posts")))
+        self.assertIsNotNone(cache.get(object_key(Post, other_post.pk)))
+        self.assertIsNone(cache.get(object_key(Post, self.post.pk)))
+        self.assertContains(
+            self.client.get(reverse("posts:index")), "edited text"
+        )
+
+    def test_only_affected_feeds_are_invalidated(self):
+        other_author = User.objects.create(username="other_author")
+        for url in (
+            reverse("posts:group_list", args=["test-slug"]),
+            reverse("posts:group_list", args=["other-slug"]),
+            reverse("posts:profile", args=["author"]),
+            reverse("posts:profile", args=["other_author"]),
+        ):
+            self.client.get(url)
+        Post.objects.create(
+            author=other_author, group=TestPostsCache.other_group, text="text"
+        )
+        for scope, cached in (
+            (f"group:{TestPostsCache.group.pk}", True),
+            (f"group:{TestPostsCache.other_group.pk}", False),
+            (f"author:{TestPostsCache.user.pk}", True),
+            (f"author:{other_author.pk}", False),
+        ):
+            with self.subTest(scope=scope):
+                self.assertEqual(
+                    cache.get(id_list_key(scope)) is not None, cached
+                )
+
+    def test_post_card_is_cached_until_post_changes(self):
+        url = reverse("posts:profile", args=["author"])
+        self.client.get(url)
+        posts = Post.objects.filter(pk=self.post.pk)
+        posts.update(text="changed without signals")
+        cache.delete(object_key(Post, self.post.pk))
+        bump_versions("author:author")
+        self.assertContains(self.client.get(url), "test text")
+        posts.update(updated=timezone.now())
+        cache.delete(object_key(Post, self.post.pk))
+        bump_versions("author:author")
+        self.assertContains(self.client.get(url), "changed without signals")
+
+    def test_deleted_group_is_dropped_from_cached_posts(self):
+        group = Group.objects.create(
+            title="gone", slug="gone-slug", description="description"
+        )
+        Post.objects.create(
+            author=TestPostsCache.user, group=group, text="text"
+        )
+        url = reverse("posts:group_list", args=["gone-slug"])
+        self.assertContains(self.client.get(reverse("posts:index")), url)
+        group.delete()
+        self.assertNotContains(self.client.get(reverse("posts:index")), url)
+
+    def test_only_card_fields_touch_posts(self):
+        user = User.objects.create(username="card_author")
+        group = Group.objects.create(
+            title="card", slug="card-slug", description="description"
+        )
+        Post.objects.create(author=user, group=group, text="text")
+
+        def updated():
+            return list(Post.objects.values_list("updated", flat=True))
+
+        before = updated()
+        user.set_password("new password")
+        user.save()
+        group.description = "new description"
+        group.save()
+        self.assertEqual(updated(), before)
+        user.first_name = "Name"
+        user.save()
+        self.assertNotEqual(updated(), before)
+        before = updated()
+        group.slug = "new-slug"
+        group.save()
+        self.assertNotEqual(updated(), before)
+
+    def test_shared_page_fills_user_fragments(self):
+        reader = User.objects.create(username="reader")
+        url = reverse("posts:profile", args=["author"])
+        self.client.get(url)
+        Post.objects.update(text="changed without signals")
+        reader_client = Client()
+        reader_client.force_login(reader)
+        responses = {
+            "": Client().get(url),
+            "reader": reader_client.get(url),
+            "author": self.client.get(url),
+        }
+        for username, response in responses.items():
+            with self.subTest(username=username):
+                self.assertNotIn("page_obj", response.context)
+                self.assertContains(response, "test text")
+                self.assertNotContains(response, "<!--fragment:")
+        self.assertContains(responses[""], reverse("login"))
+        self.assertContains(responses["reader"], "reader</a>")
+        self.assertContains(responses["reader"], "Подписаться")
+        self.assertContains(responses["author"], "author</a>")
+        self.assertNotContains(responses["author"], "reader</a>")
+        self.assertNotContains(responses["author"], "Подписаться")
+
+    def test_hydrate_queries_only_missing_posts(self):
+        posts = [
+            Post.objects.create(author=TestPostsCache.user, text="text")
+            for _ in range(3)
+        ]
+        ids = [post.pk for post in posts]
+        hydrate(ids[:2])
+        with self.assertNumQueries(1):
+            self.assertEqual(hydrate(ids[::-1]), posts[::-1])
+        with self.assertNumQueries(0):
+            hydrated = hydrate(ids)
+            self.assertEqual(hydrated[0].author, TestPostsCache.user)
+
+
+class TestGetOrCompute(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def compute(self, value):
+        self.calls += 1
+        return value
+
+    def test_fresh_value_is_computed_once(self):
+        self.calls = 0
+        for _ in range(3):
+            self.assertEqual(
+                get_or_compute("key", lambda: self.compute(1), 60), 1
+            )
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_is_served_while_another_request_refreshes(self):
+        self.calls = 0
+        cache.set("key", ("stale", time.time() - 1), 60)
+        cache.add("lock:key", True)
+        self.assertEqual(
+            get_or_compute("key", lambda: self.compute("fresh"), 60), "stale"
+        )
+        self.assertEqual(self.calls, 0)
+        cache.delete("lock:key")
+        self.assertEqual(
+            get_or_compute("key", lambda: self.compute("fresh"), 60), "fresh"
+        )
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(cache.get("lock:key"))
+
+    @override_settings(CACHE_LOCK_TIMEOUT=0.2, CACHE_LOCK_POLL_INTERVAL=0.01)
+    def test_cold_miss_waits_for_the_lock_holder(self):
+        self.calls = 0
+        cache.add("lock:key", True)
+        self.assertEqual(
+            get_or_compute("key", lambda: self.compute(1), 60), 1
+        )
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(cache.get("key"))
+
+    def test_uncacheable_value_is_not_stored(self):
+        get_or_compute("key", lambda: None, 60, cacheable=bool)
+        self.assertIsNone(cache.get("key"))
+
+    @override_settings(CACHE_LOCK_TIMEOUT=10, CACHE_LOCK_POLL_INTERVAL=0.01)
+    def test_waiters_stop_when_lock_is_released_without_value(self):
+        def slow(value):
+            time.sleep(0.1)
+            if isinstance(value, Exception):
+                raise value
+            return value
+
+        def call(value):
+            try:
+                return get_or_compute(
+                    "key", lambda: slow(value), 60, cacheable=bool
+                )
+            except ValueError:
+                return "error"
+
+        for value, results in (
+            (None, [None] * 3),
+            (ValueError(), ["error"] * 3),
+        ):
+            with self.subTest(value=value):
+                cache.clear()
+                started = time.monotonic()
+                with ThreadPoolExecutor(max_workers=3) as executor:
+                    futures = [
+                        executor.submit(call, value) for _ in range(3)
+                    ]
+                    self.assertEqual(
+                        [future.result() for future in futures], results
+                    )
+                self.assertLess(time.monotonic() - started, 2)
+                self.assertIsNone(cache.get("lock:key"))
+
+    @override_settings(CACHE_TTL_JITTER=0.1)
+    def test_timeouts_are_jittered(self):
+        timeouts = {jittered(100) for _ in range(20)}
+        self.assertGreater(len(timeouts), 1)
+        for timeout in timeouts:
+            self.assertTrue(90 <= timeout <= 100)
+
+
+class TestConditionalGet(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username="author")
+        cls.post = Post.objects.create(author=cls.user, text="test text")
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(TestConditionalGet.user)
+        self.urls = [
+            reverse("posts:index"),
+            reverse("posts:profile", args=["author"]),
+            reverse("posts:follow_index"),
+            reverse("posts:post_detail", args=[TestConditionalGet.post.pk]),
+        ]
+
+    def test_unchanged_page_is_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertTrue(response.has_header("Last-Modified"))
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response["ETag"]
+                )
+                self.assertEqual(response.status_code, 304)
+                self.assertIsNone(response.context)
+
+    def test_changed_page_is_sent_again(self):
+        etags = [self.client.get(url)["ETag"] for url in self.urls]
+        Comment.objects.create(
+            author=TestConditionalGet.user,
+            post=TestConditionalGet.post,
+            text="comment",
+        )
+        Post.objects.create(author=TestConditionalGet.user, text="new text")
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_renamed_author_or_group_is_sent_again(self):
+        group = Group.objects.create(
+            title="group", slug="etag-group", description="description"
+        )
+        post = Post.objects.create(
+            author=TestConditionalGet.user, group=group, text="text"
+        )
+        urls = [
+            reverse("posts:group_list", args=[group.slug]),
+            reverse("posts:post_detail", args=[post.pk]),
+            reverse("posts:profile", args=["author"]),
+        ]
+        author = TestConditionalGet.user
+        for instance, field, value in (
+            (group, "title", "renamed group"),
+            (author, "first_name", "Renamed"),
+        ):
+            etags = [self.client.get(url)["ETag"] for url in urls]
+            setattr(instance, field, value)
+            instance.save()
+            for url, etag in zip(urls, etags):
+                with self.subTest(url=url, field=field):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_new_user_or_password_keeps_pages(self):
+        url = reverse("posts:index")
+        etag = self.client.get(url)["ETag"]
+        user = User.objects.create(username="newcomer")
+        user.set_password("password")
+        user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_differs_between_users(self):
+        url = reverse("posts:index")
+        self.assertNotEqual(
+            self.client.get(url)["ETag"], Client().get(url)["ETag"]
+        )
+
+    def test_etag_changes_with_csrf_token(self):
+        url = reverse("posts:post_detail", args=[TestConditionalGet.post.pk])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        del self.client.cookies[settings.CSRF_COOKIE_NAME]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
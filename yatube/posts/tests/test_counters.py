@@ -0,0 +1,114 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from ..counters import user_counters
+from ..models import Comment, Follow, Group, Post, User, UserCounters
+
+
+class TestCounters(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username="author")
+        cls.reader = User.objects.create(username="reader")
+        cls.group = Group.objects.create(
+            title="test title", slug="test-slug", description="description"
+        )
+        cls.other_group = Group.objects.create(
+            title="other title", slug="other-slug", description="description"
+        )
+
+    def counters(self, user):
+        return user_counters(User.objects.get(pk=user.pk))
+
+    def test_posts_are_counted_per_author_and_group(self):
+        post = Post.objects.create(
+            author=TestCounters.author, group=TestCounters.group, text="text"
+        )
+        self.assertEqual(self.counters(TestCounters.author).posts_count, 1)
+        TestCounters.group.refresh_from_db()
+        self.assertEqual(TestCounters.group.posts_count, 1)
+        post.group = TestCounters.other_group
+        post.save()
+        for group, expected in (
+            (TestCounters.group, 0),
+            (TestCounters.other_group, 1),
+        ):
+            group.refresh_from_db()
+            self.assertEqual(group.posts_count, expected)
+        post.delete()
+        self.assertEqual(self.counters(TestCounters.author).posts_count, 0)
+        TestCounters.other_group.refresh_from_db()
+        self.assertEqual(TestCounters.other_group.posts_count, 0)
+
+    def test_comments_are_counted_per_post(self):
+        post = Post.objects.create(author=TestCounters.author, text="text")
+        comment = Comment.objects.create(
+            post=post, author=TestCounters.reader, text="comment"
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_saving_stale_instances_keeps_counters(self):
+        group = Group.objects.create(
+            title="stale title", slug="stale-slug", description="description"
+        )
+        post = Post.objects.create(
+            author=TestCounters.author, group=group, text="text"
+        )
+        Comment.objects.create(
+            post=post, author=TestCounters.reader, text="comment"
+        )
+        group.title = "new title"
+        group.save()
+        post.text = "new text"
+        post.save()
+        group.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(group.title, "new title")
+        self.assertEqual(group.posts_count, 1)
+        self.assertEqual(post.text, "new text")
+        self.assertEqual(post.comments_count, 1)
+        response = self.client.get(
+            reverse("posts:group_list", kwargs={"slug": group.slug})
+        )
+        self.assertEqual(list(response.context["page_obj"]), [post])
+
+    def test_drifted_counters_do_not_go_below_zero(self):
+        Post.objects.bulk_create(
+            [Post(author=TestCounters.author, group=TestCounters.group)]
+        )
+        Post.objects.get(group=TestCounters.group).delete()
+        TestCounters.group.refresh_from_db()
+        self.assertEqual(TestCounters.group.posts_count, 0)
+        self.assertEqual(self.counters(TestCounters.author).posts_count, 0)
+
+    def test_follows_are_counted_for_both_users(self):
+        follow = Follow.objects.create(
+            user=TestCounters.reader, author=TestCounters.author
+        )
+        self.assertEqual(self.counters(TestCounters.author).followers_count, 1)
+        self.assertEqual(self.counters(TestCounters.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.counters(TestCounters.author).followers_count, 0)
+        self.assertEqual(self.counters(TestCounters.reader).following_count, 0)
+
+    def test_rebuild_counters_fixes_drift(self):
+        Post.objects.create(
+            author=TestCounters.author, group=TestCounters.group, text="text"
+        )
+        UserCounters.objects.update(posts_count=5)
+        Group.objects.update(posts_count=7)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_counters", "--check", stdout=StringIO())
+        call_command("rebuild_counters", stdout=StringIO())
+        call_command("rebuild_counters", "--check", stdout=StringIO())
+        self.assertEqual(self.counters(TestCounters.author).posts_count, 1)
+        TestCounters.group.refresh_from_db()
+        self.assertEqual(TestCounters.group.posts_count, 1)
@@ -1,7 +1,15 @@
-from django.test import Client, TestCase
+from importlib import import_module
+from io import StringIO
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
-from ..models import Follow, Post, User
+from ..feeds import timeline_count_key
+from ..models import Follow, Post, PulledAuthor, TimelineEntry, User
+from ..views import POSTS_ON_PAGE
 
 
 class TestFollowing(TestCase):
@@ -52,3 +60,136 @@ class TestFollowing(TestCase):
         self.assertEqual(len(response_1.context["page_obj"]), 0)
         response_2 = self.user_2_client.get(reverse("posts:follow_index"))
         self.assertEqual(response_2.context["page_obj"][0], TestFollowing.post)
+
+    def test_profile_shows_follow_button_for_current_user(self):
+        url = reverse(
+            "posts:profile", kwargs={"username": TestFollowing.author.username}
+        )
+        response = self.user_1_client.get(url)
+        self.assertContains(response, "Подписаться")
+        self.assertNotContains(response, "Отписаться")
+        response = self.user_2_client.get(url)
+        self.assertContains(response, "Отписаться")
+        self.assertNotContains(response, "Подписаться")
+
+    def test_follow_index_count_is_cached_until_follows_change(self):
+        user = TestFollowing.user_1
+        key = timeline_count_key(user.pk)
+        cache.clear()
+        self.user_1_client.get(reverse("posts:follow_index"))
+        self.assertIsNotNone(cache.get(key))
+        Follow.objects.create(user=user, author=TestFollowing.author)
+        self.assertIsNone(cache.get(key))
+        response = self.user_1_client.get(reverse("posts:follow_index"))
+        self.assertEqual(response.context["page_obj"].paginator.count, 1)
+
+    def test_new_post_is_pushed_to_followers_timelines(self):
+        post = Post.objects.create(author=TestFollowing.author, text="new")
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=TestFollowing.user_2, post=post
+            ).exists()
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(
+                user=TestFollowing.user_1, post=post
+            ).exists()
+        )
+
+    def test_follow_backfills_and_unfollow_clears_timeline(self):
+        follow = Follow.objects.create(
+            user=TestFollowing.user_1, author=TestFollowing.author
+        )
+        self.assertEqual(
+            list(TestFollowing.user_1.timeline.values_list("post", flat=True)),
+            [TestFollowing.post.pk],
+        )
+        follow.delete()
+        self.assertFalse(TestFollowing.user_1.timeline.exists())
+
+
+@override_settings(POSTS_FANOUT_FOLLOWER_LIMIT=4, POSTS_MAX_NUMBERED_PAGE=1)
+class TestHybridFollowFeed(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username="reader")
+        cls.star = User.objects.create(username="star")
+        cls.author = User.objects.create(username="author")
+        Follow.objects.create(user=cls.reader, author=cls.star)
+        for i in range(3):
+            user = User.objects.create(username=f"fan_{i}")
+            Follow.objects.create(user=user, author=cls.star)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(TestHybridFollowFeed.reader)
+
+    def test_popular_author_is_pulled_instead_of_pushed(self):
+        star = TestHybridFollowFeed.star
+        self.assertTrue(PulledAuthor.objects.filter(author=star).exists())
+        post = Post.objects.create(author=star, text="star post")
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+
+    def test_follow_feed_merges_pushed_and_pulled_posts(self):
+        posts = [
+            Post.objects.create(author=author, text=f"post {i}")
+            for i in range(POSTS_ON_PAGE)
+            for author in (
+                TestHybridFollowFeed.star, TestHybridFollowFeed.author
+            )
+        ]
+        posts.reverse()
+        response = self.client.get(reverse("posts:follow_index"))
+        page_obj = response.context["page_obj"]
+        self.assertEqual(list(page_obj), posts[:POSTS_ON_PAGE])
+        response = self.client.get(
+            reverse("posts:follow_index") + f"?cursor={page_obj.next_cursor}"
+        )
+        self.assertEqual(
+            list(response.context["page_obj"]), posts[POSTS_ON_PAGE:]
+        )
+
+    def test_author_is_pushed_again_when_followers_leave(self):
+        star = TestHybridFollowFeed.star
+        post = Post.objects.create(author=star, text="star post")
+        Follow.objects.filter(user__username__startswith="fan_").delete()
+        self.assertTrue(PulledAuthor.objects.filter(author=star).exists())
+        self.assertFalse(
+            TimelineEntry.objects.filter(
+                user=TestHybridFollowFeed.reader, post=post
+            ).exists()
+        )
+        call_command("push_authors", stdout=StringIO())
+        self.assertFalse(PulledAuthor.objects.filter(author=star).exists())
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=TestHybridFollowFeed.reader, post=post
+            ).exists()
+        )
+
+    def test_migration_pulls_authors_with_many_followers(self):
+        PulledAuthor.objects.all().delete()
+        migration = import_module("posts.migrations.0022_pull_popular_authors")
+        migration.pull_popular_authors(apps, None)
+        self.assertEqual(
+            list(PulledAuthor.objects.values_list("author", flat=True)),
+            [TestHybridFollowFeed.star.pk],
+        )
+
+    @override_settings(POSTS_TIMELINE_BACKFILL=2)
+    def test_migration_fills_capped_timelines_of_pushed_authors(self):
+        for author in (TestHybridFollowFeed.star, TestHybridFollowFeed.author):
+            for i in range(3):
+                Post.objects.create(author=author, text=f"post {i}")
+        TimelineEntry.objects.all().delete()
+        migration = import_module("posts.migrations.0014_timelineentry")
+        migration.fill_timelines(apps, None)
+        latest = Post.objects.filter(
+            author=TestHybridFollowFeed.author
+        ).order_by("-pub_date", "-pk")[:2]
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list("post", flat=True)),
+            {post.pk for post in latest},
+        )
@@ -1,11 +1,17 @@
+import hashlib
+import io
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+from PIL.ImageFile import ImageFile
 
+from ..forms import PostForm
 from ..models import Comment, Group, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -68,7 +74,11 @@ class PostsFormsTest(TestCase):
         self.assertEqual(created_post.author, PostsFormsTest.user)
         self.assertEqual(created_post.text, form_data["text"])
         self.assertEqual(created_post.group, PostsFormsTest.group)
-        self.assertEqual(created_post.image, "posts/" + uploaded.name)
+        digest = hashlib.sha256(small_gif).hexdigest()
+        self.assertEqual(
+            created_post.image,
+            f"posts/{digest[:2]}/{digest[2:4]}/{digest}.gif",
+        )
 
     def test_valid_form_edit_post(self):
         form_data = {
@@ -152,3 +162,76 @@ class PostsFormsTest(TestCase):
             data=form_data,
         )
         self.assertEqual(Comment.objects.count(), comments_count)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostFormImageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def upload(size, mode="RGB", ext="JPEG", name="image.jpg", **options):
+        file_obj = io.BytesIO()
+        Image.new(mode, size, "red").save(file_obj, ext, **options)
+        return SimpleUploadedFile(name, file_obj.getvalue())
+
+    def clean(self, upload):
+        form = PostForm(data={"text": "text"}, files={"image": upload})
+        form.is_valid()
+        return form
+
+    def test_small_image_is_kept(self):
+        upload = self.upload((50, 50), "RGBA", "PNG", "image.png")
+        form = self.clean(upload)
+        self.assertTrue(form.is_valid())
+        self.assertIs(form.cleaned_data["image"], upload)
+
+    @override_settings(POSTS_IMAGE_MAX_SIDE=100)
+    def test_big_image_is_downscaled(self):
+        for upload, size, image_format in (
+            (self.upload((400, 200)), (100, 50), "JPEG"),
+            (self.upload((90, 300), ext="BMP", name="a.bmp"), (30, 100),
+             "JPEG"),
+            (self.upload((300, 300), "RGBA", "PNG", "a.png"), (100, 100),
+             "PNG"),
+        ):
+            with self.subTest(name=upload.name):
+                form = self.clean(upload)
+                self.assertTrue(form.is_valid(), form.errors)
+                with Image.open(form.cleaned_data["image"]) as image:
+                    self.assertEqual(image.size, size)
+                    self.assertEqual(image.format, image_format)
+
+    @override_settings(POSTS_IMAGE_MAX_SIDE=100)
+    def test_exif_orientation_is_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        form = self.clean(self.upload((400, 200), exif=exif))
+        with Image.open(form.cleaned_data["image"]) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertNotIn("exif", image.info)
+
+    def test_big_jpeg_is_decoded_at_reduced_scale(self):
+        upload = self.upload((8165, 6124))
+        with mock.patch.object(
+            Image.Image, "resize", autospec=True,
+            side_effect=Image.Image.resize,
+        ) as resize:
+            form = self.clean(upload)
+        self.assertTrue(form.is_valid(), form.errors)
+        decoded = resize.call_args[0][0]
+        self.assertEqual(decoded.size, (4083, 3062))
+        with Image.open(form.cleaned_data["image"]) as image:
+            self.assertEqual(image.size, (2048, 1536))
+
+    @override_settings(POSTS_UPLOAD_MAX_PIXELS=50 * 50 - 1)
+    def test_too_many_pixels_are_rejected_before_decoding(self):
+        with mock.patch.object(ImageFile, "load") as load:
+            form = self.clean(self.upload((50, 50)))
+        load.assert_not_called()
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["image"][0], (
+            "Картинка слишком большая: не больше 0 мегапикселей."
+        ))
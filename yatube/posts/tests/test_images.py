@@ -0,0 +1,348 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..images import (
+    attach_thumbnails,
+    cached_thumbnail,
+    image_lock,
+    make_thumbnails,
+    process_post_image,
+)
+from ..models import Post, User
+from ..templatetags.post_images import post_image, thumbnail_url
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def image_content(size=(80, 60), ext="PNG"):
+    file_obj = io.BytesIO()
+    Image.new("RGB", size, "red").save(file_obj, ext)
+    return file_obj.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_IMAGE_WORKERS=0)
+class TestThumbnails(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username="author")
+        self.post = Post.objects.create(author=self.author, text="text")
+        self.post.image.save("image.png", ContentFile(image_content()))
+
+    def test_templates_show_original_until_thumbnail_is_made(self):
+        image = self.post.image
+        self.assertIsNone(cached_thumbnail(image.name))
+        self.assertEqual(thumbnail_url(image), image.url)
+        self.assertEqual(post_image(self.post)["src"], image.url)
+        self.assertIsNone(cached_thumbnail(image.name))
+
+        self.assertTrue(process_post_image(self.post.pk, image.name))
+        thumbnail = cached_thumbnail(image.name)
+        self.assertIsNotNone(thumbnail)
+        self.assertEqual(thumbnail.size, [960, 339])
+        self.assertEqual(thumbnail_url(image), thumbnail.url)
+
+    @override_settings(
+        POSTS_IMAGE_WIDTHS=(320, 960), POSTS_IMAGE_FORMATS=("WEBP", "JPEG")
+    )
+    def test_variants_are_recorded_on_post(self):
+        process_post_image(self.post.pk, self.post.image.name)
+        post = Post.objects.get(pk=self.post.pk)
+        variants = json.loads(post.image_variants)
+        self.assertEqual(list(variants), ["image/webp", "image/jpeg"])
+        for mime_type, thumbnails in variants.items():
+            self.assertEqual([width for width, _ in thumbnails], [320, 960])
+            for width, name in thumbnails:
+                with Image.open(default_storage.open(name)) as thumbnail:
+                    self.assertEqual(thumbnail.width, width)
+                    self.assertEqual(
+                        thumbnail.get_format_mimetype(), mime_type
+                    )
+
+        context = post_image(post)
+        webp, jpeg = variants["image/webp"], variants["image/jpeg"]
+        self.assertEqual(
+            context["sources"],
+            [
+                {
+                    "type": "image/webp",
+                    "srcset": f"{default_storage.url(webp[0][1])} 320w, "
+                    f"{default_storage.url(webp[1][1])} 960w",
+                }
+            ],
+        )
+        self.assertEqual(context["src"], default_storage.url(jpeg[1][1]))
+        self.assertIn("960w", context["srcset"])
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response, '<source type="image/webp"')
+
+    def test_new_image_drops_variants(self):
+        process_post_image(self.post.pk, self.post.image.name)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertTrue(post.image_variants)
+        post.text = "edited"
+        post.save()
+        self.assertTrue(Post.objects.get(pk=self.post.pk).image_variants)
+        post.image.save("other.png", ContentFile(image_content((40, 30))))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).image_variants, "")
+
+    def test_page_thumbnails_are_read_in_one_lookup(self):
+        posts = [self.post] + [
+            Post.objects.create(author=self.author, text="text")
+            for _ in range(3)
+        ]
+        for post in posts[1:]:
+            post.image.save(
+                "image.png", ContentFile(image_content((post.pk, 10)))
+            )
+        make_thumbnails(posts[0].image.name)
+        make_thumbnails(posts[1].image.name)
+        cache.clear()
+        with self.assertNumQueries(1):
+            attach_thumbnails(posts)
+        with self.assertNumQueries(0):
+            attach_thumbnails(posts)
+        for post in posts[:2]:
+            self.assertEqual(
+                post.thumbnail_url, cached_thumbnail(post.image.name).url
+            )
+        for post in posts[2:]:
+            self.assertEqual(post.thumbnail_url, post.image.url)
+
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response, posts[0].thumbnail_url)
+        self.assertContains(response, posts[3].image.url)
+
+    def test_placeholder_is_computed_when_image_is_saved(self):
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (80, 60)
+        )
+        self.assertTrue(
+            self.post.image_placeholder.startswith("data:image/webp;base64,")
+        )
+        data = base64.b64decode(self.post.image_placeholder.split(",")[1])
+        with Image.open(io.BytesIO(data)) as preview:
+            self.assertEqual(preview.size, (20, 7))
+        context = post_image(self.post)
+        self.assertEqual((context["width"], context["height"]), (80, 60))
+        self.assertEqual(context["placeholder"], self.post.image_placeholder)
+
+        process_post_image(self.post.pk, self.post.image.name)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.image_placeholder, self.post.image_placeholder)
+        context = post_image(post)
+        self.assertEqual((context["width"], context["height"]), (960, 339))
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, f"url({post.image_placeholder})")
+
+    def test_placeholder_follows_exif_orientation(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        content = io.BytesIO()
+        Image.new("RGB", (80, 60), "red").save(content, "JPEG", exif=exif)
+        self.post.image.save("rotated.jpg", ContentFile(content.getvalue()))
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (60, 80)
+        )
+
+    def test_backfill_fills_missing_placeholders(self):
+        process_post_image(self.post.pk, self.post.image.name)
+        Post.objects.update(
+            image_width=None, image_height=None, image_placeholder=""
+        )
+        call_command("backfill_thumbnails", workers=0, stdout=io.StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (80, 60))
+        self.assertEqual(post.image_placeholder, self.post.image_placeholder)
+
+    def test_made_thumbnail_refreshes_post_card(self):
+        updated = Post.objects.get(pk=self.post.pk).updated
+        process_post_image(self.post.pk, self.post.image.name)
+        self.assertGreater(Post.objects.get(pk=self.post.pk).updated, updated)
+
+    def test_backfill_command(self):
+        out = io.StringIO()
+        call_command("backfill_thumbnails", workers=0, stdout=out)
+        self.assertIsNotNone(cached_thumbnail(self.post.image.name))
+        self.assertTrue(Post.objects.get(pk=self.post.pk).image_variants)
+        self.assertIn("Обработано картинок: 1, с ошибками: 0", out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_IMAGE_WORKERS=0)
+class TestQueueThumbnails(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username="author")
+        self.client.force_login(self.author)
+
+    def test_post_create_queues_thumbnails(self):
+        self.client.post(
+            reverse("posts:post_create"),
+            {
+                "text": "text",
+                "image": SimpleUploadedFile("new.png", image_content()),
+            },
+        )
+        post = Post.objects.get()
+        self.assertIsNotNone(cached_thumbnail(post.image.name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_IMAGE_WORKERS=0)
+class TestContentAddressedImages(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username="author")
+        self.content = image_content()
+
+    def create_post(self, name="image.png", content=None):
+        post = Post.objects.create(author=self.author, text="text")
+        post.image.save(name, ContentFile(content or self.content))
+        return post
+
+    def test_identical_images_share_file(self):
+        first = self.create_post("first.png")
+        second = self.create_post("second.PNG")
+        other = self.create_post(content=image_content(ext="GIF"))
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(
+            first.image.name, f"posts/{digest[:2]}/{digest[2:4]}/{digest}.png"
+        )
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertNotEqual(other.image.name, first.image.name)
+        self.assertFalse(
+            [
+                name
+                for _, _, names in os.walk(os.path.join(TEMP_MEDIA_ROOT))
+                for name in names
+                if name.endswith(".part")
+            ]
+        )
+
+    def test_file_is_deleted_with_last_post(self):
+        first, second = self.create_post(), self.create_post()
+        name = first.image.name
+        process_post_image(first.pk, name)
+        thumbnail = cached_thumbnail(name)
+        first.delete()
+        self.assertTrue(default_storage.exists(name))
+        second.image.save("new.png", ContentFile(image_content((10, 10))))
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(thumbnail.name))
+        self.assertIsNone(cached_thumbnail(name))
+
+    def test_reused_file_deleted_before_commit_is_saved_again(self):
+        name = self.create_post().image.name
+        with transaction.atomic():
+            post = Post.objects.create(
+                author=self.author,
+                text="text",
+                image=SimpleUploadedFile("same.png", self.content),
+            )
+            self.assertEqual(post.image.name, name)
+            # The release of the last other post checked for posts before
+            # this one was committed.
+            default_storage.delete(name)
+        self.assertTrue(default_storage.exists(name))
+        with default_storage.open(name) as file:
+            self.assertEqual(file.read(), self.content)
+
+    def test_file_is_not_deleted_under_lock(self):
+        post = self.create_post()
+        name = post.image.name
+        with image_lock(name):
+            with override_settings(CACHE_LOCK_TIMEOUT=0.1):
+                with self.assertLogs("posts.images", "ERROR"):
+                    post.delete()
+        self.assertTrue(default_storage.exists(name))
+
+    def test_dedupe_command(self):
+        legacy = FileSystemStorage(location=TEMP_MEDIA_ROOT)
+        names = [
+            legacy.save(f"posts/legacy_{i}.png", ContentFile(self.content))
+            for i in range(2)
+        ]
+        posts = [
+            Post.objects.create(author=self.author, text="text", image=name)
+            for name in names + names[:1]
+        ]
+        out = io.StringIO()
+        call_command("dedupe_images", workers=0, stdout=out)
+        self.assertIn("Перенесено файлов: 2, осталось: 1", out.getvalue())
+        digest = hashlib.sha256(self.content).hexdigest()
+        for post in posts:
+            post.refresh_from_db()
+            self.assertEqual(
+                post.image.name,
+                f"posts/{digest[:2]}/{digest[2:4]}/{digest}.png",
+            )
+            self.assertTrue(post.image_variants)
+        for name in names:
+            self.assertFalse(legacy.exists(name))
+
+    def test_relocate_command(self):
+        legacy = FileSystemStorage(location=TEMP_MEDIA_ROOT)
+        digest = hashlib.sha256(self.content).hexdigest()
+        flat = legacy.save(f"posts/{digest}.png", ContentFile(self.content))
+        other_content = image_content((10, 10))
+        named = legacy.save("posts/legacy.png", ContentFile(other_content))
+        variants = '{"image/jpeg":[[960,"cache/aa/bb/thumbnail.jpg"]]}'
+        flat_post = Post.objects.create(
+            author=self.author, text="text", image=flat,
+            image_variants=variants,
+        )
+        named_post = Post.objects.create(
+            author=self.author, text="text", image=named
+        )
+        sharded_post = self.create_post(content=image_content((20, 20)))
+        updated = flat_post.updated
+
+        out = io.StringIO()
+        call_command("relocate_images", batch_size=1, stdout=out)
+        self.assertIn("Перенесено файлов: 2, не найдено: 0", out.getvalue())
+        other_digest = hashlib.sha256(other_content).hexdigest()
+        for post, digest in (
+            (flat_post, digest),
+            (named_post, other_digest),
+        ):
+            name = f"posts/{digest[:2]}/{digest[2:4]}/{digest}.png"
+            post_image = Post.objects.get(pk=post.pk).image
+            self.assertEqual(post_image.name, name)
+            self.assertTrue(legacy.exists(name))
+            self.assertFalse(legacy.exists(post.image.name))
+        flat_post.refresh_from_db()
+        self.assertEqual(flat_post.image_variants, variants)
+        self.assertGreater(flat_post.updated, updated)
+        self.assertEqual(
+            Post.objects.get(pk=sharded_post.pk).image, sharded_post.image
+        )
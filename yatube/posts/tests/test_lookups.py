@@ -0,0 +1,79 @@
+from django.core.cache import cache
+from django.http import Http404
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.cache import version_key
+
+from ..counters import user_counters
+from ..lookups import get_cached_or_404
+from ..models import Group, Post, User
+
+
+class TestLookups(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username="author")
+        cls.group = Group.objects.create(
+            title="test title", slug="test-slug", description="description"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lookup_is_cached(self):
+        for model, value, obj in (
+            (User, "author", TestLookups.user),
+            (Group, "test-slug", TestLookups.group),
+        ):
+            with self.subTest(model=model):
+                self.assertEqual(get_cached_or_404(model, value), obj)
+                with self.assertNumQueries(0):
+                    self.assertEqual(get_cached_or_404(model, value), obj)
+
+    def test_missing_object_is_cached(self):
+        with self.assertRaises(Http404), self.assertNumQueries(1):
+            get_cached_or_404(User, "nobody")
+        with self.assertRaises(Http404), self.assertNumQueries(0):
+            get_cached_or_404(User, "nobody")
+        user = User.objects.create(username="nobody")
+        self.assertEqual(get_cached_or_404(User, "nobody"), user)
+
+    def test_missing_pages_are_answered_from_cache(self):
+        client = Client()
+        client.force_login(TestLookups.user)
+        for url, scope in (
+            (reverse("posts:profile", args=["nobody"]), "author:nobody"),
+            (reverse("posts:group_list", args=["nothing"]), "group:nothing"),
+        ):
+            with self.subTest(url=url):
+                client.get(url)
+                # Only the session and the user.
+                with self.assertNumQueries(2):
+                    self.assertEqual(client.get(url).status_code, 404)
+                self.assertIsNone(cache.get(version_key(scope)))
+
+    def test_rename_forgets_old_key(self):
+        group = Group.objects.create(
+            title="title", slug="old-slug", description="description"
+        )
+        get_cached_or_404(Group, "old-slug")
+        group.slug = "new-slug"
+        group.save()
+        with self.assertRaises(Http404):
+            get_cached_or_404(Group, "old-slug")
+        self.assertEqual(get_cached_or_404(Group, "new-slug"), group)
+
+    def test_counters_are_fresh(self):
+        user = get_cached_or_404(User, "author")
+        group = get_cached_or_404(Group, "test-slug")
+        self.assertEqual(user_counters(user).posts_count, 0)
+        self.assertEqual(group.posts_count, 0)
+        Post.objects.create(
+            author=TestLookups.user, group=TestLookups.group, text="text"
+        )
+        user = get_cached_or_404(User, "author")
+        self.assertEqual(user_counters(user).posts_count, 1)
+        group = get_cached_or_404(Group, "test-slug")
+        self.assertEqual(group.posts_count, 1)
@@ -1,7 +1,13 @@
+import base64
+
+from django.core.cache import cache
 from django.shortcuts import reverse
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
+
+from core.cache import get_or_compute
 
 from ..models import Group, Post, User
+from ..paginators import FeedPaginator
 from ..views import POSTS_ON_PAGE
 
 
@@ -36,3 +42,84 @@ class PostsPaginatorTest(TestCase):
             response = self.author_client.get(url + "?page=2")
             with self.subTest(url=url):
                 self.assertEqual(len(response.context["page_obj"]), 3)
+
+
+@override_settings(POSTS_MAX_NUMBERED_PAGE=1)
+class PostsCursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username="author")
+        for i in range(POSTS_ON_PAGE + 3):
+            Post.objects.create(text=f"test text {i}", author=cls.author)
+        cls.posts = list(Post.objects.order_by("-pub_date", "-pk"))
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def get_page(self, query):
+        response = self.client.get(reverse("posts:index") + query)
+        return response.context["page_obj"]
+
+    def test_deep_page_is_reached_by_cursor(self):
+        first_page = self.get_page("")
+        self.assertEqual(list(first_page), self.posts[:POSTS_ON_PAGE])
+        self.assertIsNotNone(first_page.next_cursor)
+        second_page = self.get_page(f"?cursor={first_page.next_cursor}")
+        self.assertIsNone(second_page.number)
+        self.assertEqual(list(second_page), self.posts[POSTS_ON_PAGE:])
+        self.assertFalse(second_page.has_next())
+        previous_page = self.get_page(
+            f"?cursor={second_page.previous_cursor}"
+        )
+        self.assertEqual(list(previous_page), self.posts[:POSTS_ON_PAGE])
+        self.assertFalse(previous_page.has_previous())
+
+    def test_last_cursor_returns_oldest_posts(self):
+        paginator = self.get_page("").paginator
+        last_page = self.get_page(f"?cursor={paginator.last_cursor}")
+        self.assertEqual(list(last_page), self.posts[-POSTS_ON_PAGE:])
+        self.assertFalse(last_page.has_next())
+        self.assertTrue(last_page.has_previous())
+
+    def test_deep_page_number_and_bad_cursor_fall_back(self):
+        naive = base64.urlsafe_b64encode(
+            b'["n",["2020-01-01T00:00:00",5]]'
+        ).decode()
+        for query in ("?page=2", "?cursor=garbage", f"?cursor={naive}"):
+            with self.subTest(query=query):
+                page = self.get_page(query)
+                self.assertEqual(page.number, 1)
+
+
+@override_settings(POSTS_ID_LIST_LENGTH=5)
+class PostsShortIdListCursorTest(PostsCursorPaginatorTest):
+    """The same pages when the cached id list ends before the feed."""
+
+
+class FeedPaginatorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_page_range_is_elided(self):
+        paginator = FeedPaginator(
+            Post.objects.all(), POSTS_ON_PAGE, count=100_000
+        )
+        ellipsis = paginator.ELLIPSIS
+        self.assertEqual(
+            list(paginator.get_elided_page_range(25)),
+            [1, 2, ellipsis, 22, 23, 24, 25, 26, 27, 28, ellipsis, 49, 50],
+        )
+        self.assertEqual(
+            list(paginator.get_elided_page_range(1)),
+            [1, 2, 3, 4, ellipsis, 49, 50],
+        )
+
+    def test_count_is_taken_from_cache(self):
+        get_or_compute("posts:count:test", lambda: 1000, 60)
+        paginator = FeedPaginator(
+            Post.objects.all(), POSTS_ON_PAGE, count_key="posts:count:test"
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(paginator.count, 1000)
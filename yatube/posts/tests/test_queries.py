@@ -0,0 +1,85 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, PulledAuthor, User
+from ..views import POSTS_ON_PAGE
+
+
+class TestViewQueries(TestCase):
+    """Every view runs the same number of queries for a full page."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username="reader")
+        cls.group = Group.objects.create(
+            title="test title", slug="test-slug", description="description"
+        )
+        for i in range(POSTS_ON_PAGE + 1):
+            author = User.objects.create(username=f"author_{i}")
+            Follow.objects.create(user=cls.reader, author=author)
+            group = Group.objects.create(
+                title=f"title {i}", slug=f"slug-{i}", description="text"
+            )
+            cls.post = Post.objects.create(
+                author=author, group=group, text=f"text {i}"
+            )
+            Post.objects.create(author=author, group=cls.group, text="text")
+        cls.author = cls.post.author
+        for i in range(POSTS_ON_PAGE):
+            author = User.objects.create(username=f"commenter_{i}")
+            Comment.objects.create(post=cls.post, author=author, text="text")
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(TestViewQueries.reader)
+
+    def test_views_run_fixed_number_of_queries(self):
+        post = TestViewQueries.post
+        author = TestViewQueries.author.username
+        urls_queries = {
+            reverse("posts:index"): 5,
+            reverse("posts:group_list", args=[TestViewQueries.group.slug]): 6,
+            reverse("posts:profile", args=[author]): 6,
+            reverse("posts:follow_index"): 6,
+            reverse("posts:post_detail", args=[post.pk]): 6,
+        }
+        for url, queries in urls_queries.items():
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+        url = reverse("posts:follow_index")
+        for pulled in (1, 3, 5):
+            PulledAuthor.objects.bulk_create(
+                PulledAuthor(author=User.objects.get(username=f"author_{i}"))
+                for i in range(pulled)
+            )
+            cache.clear()
+            with self.subTest(pulled=pulled), self.assertNumQueries(9):
+                response = self.client.get(url)
+                page_obj = response.context["page_obj"]
+                self.assertEqual(len(page_obj), POSTS_ON_PAGE)
+            PulledAuthor.objects.all().delete()
+
+    def test_write_views_run_fixed_number_of_queries(self):
+        post = TestViewQueries.post
+        author = TestViewQueries.author.username
+        self.client.force_login(TestViewQueries.author)
+        urls_queries = {
+            reverse("posts:post_create"): 3,
+            reverse("posts:post_edit", args=[post.pk]): 5,
+        }
+        for url, queries in urls_queries.items():
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                self.client.get(url)
+        self.client.force_login(TestViewQueries.reader)
+        urls_queries = {
+            reverse("posts:add_comment", args=[post.pk]): 5,
+            reverse("posts:profile_unfollow", args=[author]): 10,
+            reverse("posts:profile_follow", args=[author]): 11,
+        }
+        for url, queries in urls_queries.items():
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                self.client.post(url, {"text": "comment"})
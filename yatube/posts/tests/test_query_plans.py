@@ -0,0 +1,70 @@
+import re
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+from ..paginators import NEXT, encode_cursor
+
+FULL_SCAN_OR_SORT = re.compile(r"^SCAN (TABLE )?\w+$|USE TEMP B-TREE")
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite")
+class TestQueryPlans(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username="reader")
+        cls.author = User.objects.create(username="author")
+        cls.group = Group.objects.create(
+            title="test title", slug="test-slug", description="description"
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(3):
+            cls.post = Post.objects.create(
+                author=cls.author, group=cls.group, text=f"text {i}"
+            )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text="comment"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(TestQueryPlans.reader)
+
+    def query_plans(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        for query in context.captured_queries:
+            if not query["sql"].startswith("SELECT"):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                yield query["sql"], [row[-1] for row in cursor.fetchall()]
+
+    def test_view_queries_use_indexes(self):
+        cursor = encode_cursor(NEXT, TestQueryPlans.post)
+        urls = []
+        for url in (
+            reverse("posts:index"),
+            reverse("posts:group_list", args=[TestQueryPlans.group.slug]),
+            reverse("posts:profile", args=[TestQueryPlans.author.username]),
+            reverse("posts:follow_index"),
+        ):
+            urls += [url, f"{url}?cursor={cursor}"]
+        urls.append(
+            reverse("posts:post_detail", args=[TestQueryPlans.post.pk])
+        )
+        for url in urls:
+            for sql, plan in self.query_plans(url):
+                with self.subTest(url=url, sql=sql):
+                    self.assertEqual(
+                        [step for step in plan
+                         if FULL_SCAN_OR_SORT.search(step)],
+                        [],
+                    )
@@ -0,0 +1,50 @@
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from ..feeds import hydrate, id_list_key
+from ..models import Group, Post, User
+from ..warming import warm_cache, warm_urls
+
+
+class TestWarmCache(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(
+            title="test title", slug="test-slug", description="description"
+        )
+        self.authors = [
+            User.objects.create(username=f"author_{i}") for i in range(3)
+        ]
+        for i, author in enumerate(self.authors):
+            for _ in range(i + 1):
+                Post.objects.create(
+                    author=author, group=self.group, text="text"
+                )
+
+    def test_urls_cover_index_groups_and_top_authors(self):
+        self.assertEqual(
+            warm_urls(pages=2, authors=2),
+            [
+                reverse("posts:index"),
+                reverse("posts:index") + "?page=2",
+                reverse("posts:group_list", args=["test-slug"]),
+                reverse("posts:profile", args=["author_2"]),
+                reverse("posts:profile", args=["author_1"]),
+            ],
+        )
+
+    def test_warmed_feeds_are_cached(self):
+        urls = warm_urls(pages=1, authors=3)
+        results = warm_cache(urls, concurrency=2)
+        self.assertEqual([url for url, _, _ in results], urls)
+        self.assertTrue(all(status == 200 for _, status, _ in results))
+        scopes = ["posts", f"group:{self.group.pk}"] + [
+            f"author:{author.pk}" for author in self.authors
+        ]
+        for scope in scopes:
+            with self.subTest(scope=scope):
+                self.assertIsNotNone(cache.get(id_list_key(scope)))
+        ids = list(Post.objects.values_list("pk", flat=True))
+        with self.assertNumQueries(0):
+            hydrate(ids)
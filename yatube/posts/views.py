@@ -1,57 +1,136 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db.models import Max
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from core.cache import cache_page_versioned, condition_versioned
+
+from .counters import user_counters
+from .feeds import IdListFeed, follow_feed, timeline_count_key
 from .forms import CommentForm, PostForm
+from .images import attach_thumbnails, queue_thumbnails
+from .lookups import get_cached_or_404
 from .models import Comment, Follow, Group, Post, User
+from .paginators import FeedPaginator
 
 POSTS_ON_PAGE = 10
 
 
-@cache_page(20)
+def latest(queryset, field="pub_date"):
+    return queryset.aggregate(latest=Max(field))["latest"]
+
+
+def index_state(request):
+    return ["posts"], latest(Post.objects)
+
+
+def group_posts_state(request, slug):
+    group = get_cached_or_404(Group, slug)
+    return [f"group:{slug}"], latest(Post.objects.filter(group=group))
+
+
+def profile_state(request, username):
+    author = get_cached_or_404(User, username)
+    return [f"author:{username}"], latest(Post.objects.filter(author=author))
+
+
+def post_detail_state(request, post_id):
+    post = (
+        Post.objects.filter(pk=post_id)
+        .values("author__username", "group__slug", "pub_date")
+        .first()
+    )
+    if post is None:
+        return None
+    commented = latest(Comment.objects.filter(post_id=post_id), "created")
+    scopes = [f"post:{post_id}", f"author:{post['author__username']}"]
+    if post["group__slug"]:
+        scopes.append(f"group:{post['group__slug']}")
+    return scopes, commented or post["pub_date"]
+
+
+def request_follow_feed(request):
+    """Follow feed of the user, built once for the state and the view."""
+    if not hasattr(request, "follow_feed"):
+        request.follow_feed = follow_feed(request.user)
+    return request.follow_feed
+
+
+def follow_index_state(request):
+    posts = request_follow_feed(request)[:1]
+    return (
+        ["posts", f"author:{request.user.username}"],
+        posts[0].pub_date if posts else None,
+    )
+
+
+@condition_versioned(index_state)
+@cache_page_versioned(settings.POSTS_PAGE_CACHE_TIMEOUT, "posts")
 def index(request):
     template = "posts/index.html"
-    posts = Post.objects.all()
-    paginator = Paginator(posts, POSTS_ON_PAGE)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    posts = IdListFeed(
+        "posts", Post.objects.select_related("author", "group")
+    )
+    paginator = FeedPaginator(
+        posts, POSTS_ON_PAGE, count_key="posts:count:all"
+    )
+    page_obj = paginator.page_from_request(request)
+    attach_thumbnails(page_obj)
     context = {"page_obj": page_obj}
     return render(request, template, context)
 
 
+@condition_versioned(group_posts_state)
+@cache_page_versioned(settings.POSTS_PAGE_CACHE_TIMEOUT, "group:{slug}")
 def group_posts(request, slug):
     template = "posts/group_list.html"
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, POSTS_ON_PAGE)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    group = get_cached_or_404(Group, slug)
+    posts = IdListFeed(
+        f"group:{group.pk}", group.posts.select_related("author", "group")
+    )
+    paginator = FeedPaginator(posts, POSTS_ON_PAGE, count=group.posts_count)
+    page_obj = paginator.page_from_request(request)
+    attach_thumbnails(page_obj)
     context = {"group": group, "page_obj": page_obj}
     return render(request, template, context)
 
 
+@condition_versioned(profile_state)
+@cache_page_versioned(settings.POSTS_PAGE_CACHE_TIMEOUT, "author:{username}")
 def profile(request, username):
     template = "posts/profile.html"
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    following = (
-        request.user.is_authenticated
-        and Follow.objects.filter(user=request.user, author=author).exists()
+    author = get_cached_or_404(User, username)
+    posts = IdListFeed(
+        f"author:{author.pk}", author.posts.select_related("author", "group")
+    )
+    counters = user_counters(author)
+    paginator = FeedPaginator(
+        posts, POSTS_ON_PAGE, count=counters.posts_count
     )
-    paginator = Paginator(posts, POSTS_ON_PAGE)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
-    context = {"author": author, "page_obj": page_obj, "following": following}
+    page_obj = paginator.page_from_request(request)
+    attach_thumbnails(page_obj)
+    context = {
+        "author": author,
+        "counters": counters,
+        "page_obj": page_obj,
+    }
     return render(request, template, context)
 
 
+@condition_versioned(post_detail_state)
 def post_detail(request, post_id):
     template = "posts/post_detail.html"
     form = CommentForm()
-    post = get_object_or_404(Post, pk=post_id)
-    comments = Comment.objects.filter(post=post)
-    count = Post.objects.filter(author=post.author).count()
+    post = get_object_or_404(
+        Post.objects.select_related("author__counters", "group"), pk=post_id
+    )
+    comments = (
+        Comment.objects.filter(post=post)
+        .select_related("author")
+        .order_by("created")
+    )
+    attach_thumbnails([post])
+    count = user_counters(post.author).posts_count
     is_owner = False
     if request.user == post.author:
         is_owner = True
@@ -74,6 +153,7 @@ def post_create(request):
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    queue_thumbnails(post)
     return redirect("posts:profile", request.user.username)
 
 
@@ -95,6 +175,8 @@ def post_edit(request, post_id):
     edited_post = form.save(commit=False)
     edited_post.author = request.user
     edited_post.save()
+    if "image" in form.changed_data:
+        queue_thumbnails(edited_post)
     return redirect("posts:post_detail", post_id)
 
 
@@ -110,29 +192,29 @@ def add_comment(request, post_id):
 
 
 @login_required
+@condition_versioned(follow_index_state)
 def follow_index(request):
     template = "posts/follow.html"
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, POSTS_ON_PAGE)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    posts = request_follow_feed(request)
+    paginator = FeedPaginator(
+        posts, POSTS_ON_PAGE, count_key=timeline_count_key(request.user.pk)
+    )
+    page_obj = paginator.page_from_request(request)
+    attach_thumbnails(page_obj)
     context = {"page_obj": page_obj}
     return render(request, template, context)
 
 
 @login_required
 def profile_follow(request, username):
+    author = get_cached_or_404(User, username)
     if (
-        request.user.username == username
-        or Follow.objects.filter(
-            user=request.user,
-            author=get_object_or_404(User, username=username)
+        request.user != author
+        and not Follow.objects.filter(
+            user=request.user, author=author
         ).exists()
     ):
-        return redirect("posts:profile", username)
-    Follow.objects.create(
-        user=request.user, author=get_object_or_404(User, username=username)
-    )
+        Follow.objects.create(user=request.user, author=author)
     return redirect("posts:profile", username)
 
 
@@ -141,7 +223,7 @@ def profile_unfollow(request, username):
     following = get_object_or_404(
         Follow,
         user=request.user,
-        author=get_object_or_404(User, username=username)
+        author=get_cached_or_404(User, username)
     )
     following.delete()
     return redirect("posts:profile", username)
@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.http import Http404
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from .models import Group, UserCounters
+
+
+def warm_urls(pages=None, authors=None):
+    """
+    URLs of the first pages of index, every group page and the profiles of
+    the authors with most posts.
+    """
+    pages = settings.CACHE_WARM_PAGES if pages is None else pages
+    authors = settings.CACHE_WARM_AUTHORS if authors is None else authors
+    index = reverse("posts:index")
+    urls = [index] + [f"{index}?page={page}" for page in range(2, pages + 1)]
+    urls += [
+        reverse("posts:group_list", args=[slug])
+        for slug in Group.objects.values_list("slug", flat=True)
+    ]
+    urls += [
+        reverse("posts:profile", args=[username])
+        for username in UserCounters.objects.filter(posts_count__gt=0)
+        .order_by("-posts_count")
+        .values_list("user__username", flat=True)[:authors]
+    ]
+    return urls
+
+
+def render(url):
+    """Render url for an anonymous user, return (url, status, ms)."""
+    started = time.perf_counter()
+    request = RequestFactory().get(url)
+    request.user = AnonymousUser()
+    match = resolve(request.path_info)
+    try:
+        status = match.func(request, *match.args, **match.kwargs).status_code
+    except Http404:
+        status = 404
+    return url, status, (time.perf_counter() - started) * 1000
+
+
+def render_in_thread(url):
+    try:
+        return render(url)
+    finally:
+        connections.close_all()
+
+
+def warm_cache(urls=None, concurrency=None):
+    """
+    Fill the feed and post caches before a worker takes traffic, e.g. from
+    the post_worker_init hook of gunicorn. They are shared by all users, so
+    an anonymous render is enough.
+    """
+    urls = warm_urls() if urls is None else urls
+    concurrency = concurrency or settings.CACHE_WARM_CONCURRENCY
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(render_in_thread, urls))
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.AnonymousMicroCacheMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -102,7 +103,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+# Hot keys are served from an in-process L1 in front of the "shared" cache,
+# an SQLite file used by all worker processes on the host, see
+# core.cache_backends.
+CACHES = {
+    "default": {
+        "BACKEND": "core.cache_backends.TieredCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache-changes.sqlite3"),
+        "OPTIONS": {"L2": "shared", "L1_TIMEOUT": 5, "POLL_INTERVAL": 0.5},
+    },
+    "shared": {
+        "BACKEND": "core.cache_backends.SQLiteCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache.sqlite3"),
+        "OPTIONS": {"MAX_ENTRIES": 100_000, "MAX_SIZE": 256 * 1024 * 1024},
+    },
+}
+# Cache timeouts are cut by up to this share at random.
+CACHE_TTL_JITTER = 0.1
+# Expired entries are still served this many seconds while one request
+# recomputes them.
+CACHE_STALE_TIMEOUT = 60
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_POLL_INTERVAL = 0.05
+# Tests use caches in a temporary directory.
+TEST_RUNNER = "core.runner.TestRunner"
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
 
@@ -127,3 +151,48 @@ LOGIN_REDIRECT_URL = "posts:index"
 CSRF_FAILURE_VIEW = "core.views.csrf_failure"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+
+# Feeds are paginated by page number up to this page, deeper pages
+# are reached by keyset cursors.
+POSTS_MAX_NUMBERED_PAGE = 50
+# Feed totals are cached and may lag behind by up to this many seconds.
+POSTS_COUNT_CACHE_TIMEOUT = 60
+# A new follow copies at most this many latest posts into the timeline.
+POSTS_TIMELINE_BACKFILL = 1000
+POSTS_TIMELINE_BATCH_SIZE = 500
+# Posts of authors with at least this many followers are not pushed into
+# timelines but merged into the follow feed at read time.
+POSTS_FANOUT_FOLLOWER_LIMIT = 10_000
+# Feeds are cached as lists of the ids of their newest posts and read
+# from the cache of posts, which are invalidated on change, not by expiry.
+POSTS_ID_LIST_LENGTH = 1000
+POSTS_ID_LIST_TIMEOUT = 60 * 60 * 6
+POSTS_OBJECT_CACHE_TIMEOUT = 60 * 60 * 6
+# Index, group and profile pages are cached once for all users until a
+# scope they show is bumped.
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+# manage.py warm_cache renders this many index pages and profiles of this
+# many authors with most posts, besides every group page.
+CACHE_WARM_PAGES = 5
+CACHE_WARM_AUTHORS = 20
+CACHE_WARM_CONCURRENCY = 4
+# Users by username and groups by slug are cached for this long, and
+# unknown ones for the shorter time.
+POSTS_LOOKUP_CACHE_TIMEOUT = 60 * 60
+POSTS_LOOKUP_MISSING_TIMEOUT = 60
+# Posts pages for visitors without cookies are cached whole for this many
+# seconds, keyed by path and these query parameters.
+POSTS_MICROCACHE_TIMEOUT = 3
+POSTS_MICROCACHE_QUERY = ("page", "cursor")
+# Thumbnails are generated after post_create and post_edit by a pool of
+# this many processes, 0 generates them in the request.
+POSTS_IMAGE_WORKERS = 2
+# Every post image gets thumbnails of these widths in each of these
+# formats, the last format is the fallback for browsers without <picture>.
+POSTS_IMAGE_WIDTHS = (320, 640, 960)
+POSTS_IMAGE_FORMATS = ("WEBP", "JPEG")
+# Uploads with more pixels are rejected before they are decoded, others
+# are downscaled to this longest side and re-encoded to at most this size.
+POSTS_UPLOAD_MAX_PIXELS = 60_000_000
+POSTS_IMAGE_MAX_SIDE = 2048
+POSTS_IMAGE_MAX_BYTES = 2 * 1024 * 1024